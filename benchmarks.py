@@ -0,0 +1,289 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import functions as f
+import pricing
+from data_sources import SyntheticSource
+
+
+# Benchmark suite for the import time and the pricing, implied volatility and grid hot paths of functions.py
+# Every input is synthetic (no network), so runs are reproducible and comparable across versions
+#
+# Usage:
+#   python benchmarks.py --output bench_results.json
+#   python benchmarks.py --quick --compare bench_results.json
+
+
+RISK_FREE_RATE = 0.03
+DIVIDEND_YIELD = 0.01
+
+
+def measure(fn, repeat=3):
+    # Best wall time of repeat runs of fn() in seconds, and peak traced memory of one run in MB
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 1024 ** 2
+
+
+def random_contracts(n, seed=0):
+    # n random contracts (spot 100) with their call prices, put prices and option types
+    rng = np.random.default_rng(seed)
+    strikes = rng.uniform(50, 150, n)
+    T = rng.uniform(0.02, 2.0, n)
+    vols = rng.uniform(0.1, 0.8, n)
+    call, put = f.bs_values(100.0, strikes, RISK_FREE_RATE, T, vols, DIVIDEND_YIELD)
+    put_or_call = np.where(rng.random(n) < 0.5, 'C', 'P')
+    prices = np.where(put_or_call == 'C', call, put)
+    return strikes, T, vols, prices, put_or_call
+
+
+def bench_pricing(sizes, repeat):
+    results = []
+
+    # Scalar calls, as made by the app for the headline call and put prices
+    n_scalar = 2000
+    strikes, T, vols, _, _ = random_contracts(n_scalar)
+
+    def scalar_loop():
+        for i in range(n_scalar):
+            f.call_bs_value(100.0, strikes[i], RISK_FREE_RATE, T[i], vols[i], DIVIDEND_YIELD)
+            f.put_bs_value(100.0, strikes[i], RISK_FREE_RATE, T[i], vols[i], DIVIDEND_YIELD)
+
+    seconds, peak = measure(scalar_loop, repeat)
+    results.append(result("pricing_scalar", {"options": 2 * n_scalar}, seconds, 2 * n_scalar, peak))
+
+    # Vectorized arrays of contracts
+    for n in sizes:
+        strikes, T, vols, _, _ = random_contracts(n)
+        seconds, peak = measure(lambda: f.bs_values(100.0, strikes, RISK_FREE_RATE, T, vols, DIVIDEND_YIELD), repeat)
+        results.append(result("pricing_vectorized", {"options": 2 * n}, seconds, 2 * n, peak))
+    return results
+
+
+def bench_iv(sizes, repeat):
+    results = []
+
+    # Scalar solver latency, one option at a time
+    n_scalar = 200
+    strikes, T, _, prices, put_or_call = random_contracts(n_scalar)
+
+    def scalar_loop():
+        for i in range(n_scalar):
+            f.calculate_iv_call_put(100.0, strikes[i], RISK_FREE_RATE, T[i], prices[i], put_or_call[i], DIVIDEND_YIELD)
+
+    seconds, peak = measure(scalar_loop, repeat)
+    results.append(result("iv_scalar", {"options": n_scalar}, seconds, n_scalar, peak))
+
+    # Batched solver over a whole chain
+    for n in sizes:
+        strikes, T, _, prices, put_or_call = random_contracts(n)
+        seconds, peak = measure(lambda: f.implied_volatility(100.0, strikes, RISK_FREE_RATE, T, prices, put_or_call,
+                                                             DIVIDEND_YIELD), repeat)
+        results.append(result("iv_batched", {"options": n}, seconds, n, peak))
+    return results
+
+
+def bench_grid(resolutions, repeat):
+    results = []
+    for n in resolutions:
+        seconds, peak = measure(lambda: f.calculate_option_values(50, 150, 0.1, 0.8, 100, RISK_FREE_RATE, 1.0,
+                                                                  DIVIDEND_YIELD, 5.0, n_spot=n, n_vol=n), repeat)
+        results.append(result("option_values_grid", {"resolution": n, "cells": n * n}, seconds, 2 * n * n, peak))
+    return results
+
+
+def bench_lattice(resolutions, steps, repeat):
+    # Early exercise premium grids, one binomial lattice of the given steps per cell
+    results = []
+    for n in resolutions:
+        seconds, peak = measure(lambda: f.calculate_early_exercise_premium(50, 150, 0.1, 0.8, 100, RISK_FREE_RATE,
+                                                                           1.0, DIVIDEND_YIELD, n_spot=n, n_vol=n,
+                                                                           steps=steps), repeat)
+        results.append(result("early_exercise_grid", {"resolution": n, "steps": steps}, seconds, 2 * n * n, peak))
+    return results
+
+
+def bench_portfolio(leg_counts, repeat):
+    # Book P&L over a 41 x 21 x 3 spot x vol shift x time shift scenario grid
+    results = []
+    spot_interval, vol_shifts, time_shifts = np.linspace(50, 150, 41), np.linspace(-0.1, 0.1, 21), [0.0, 0.1, 0.5]
+    for n in leg_counts:
+        strikes, T, vols, prices, put_or_call = random_contracts(n)
+        quantity = np.random.default_rng(1).integers(-5, 6, n).astype(float)
+        legs = {'strike': strikes, 'time_to_expiration': T, 'put_or_call': put_or_call, 'quantity': quantity,
+                'cost': prices, 'vol': vols}
+        cells = n * len(spot_interval) * len(vol_shifts) * len(time_shifts)
+        seconds, peak = measure(lambda: f.portfolio_pnl(legs, spot_interval, vol_shifts, time_shifts, RISK_FREE_RATE,
+                                                        DIVIDEND_YIELD, memory_budget_mb=64), repeat)
+        results.append(result("portfolio_pnl", {"legs": n, "scenarios": cells // n}, seconds, cells, peak))
+    return results
+
+
+def bench_normalize(strike_counts, repeat):
+    # Normalization of the per-expiration chains of a source into one chain (parsing, time to expiration, dtypes)
+    results = []
+    source = SyntheticSource(expiration_days=range(1, 731, 7))
+    expirations = source.get_expirations("BENCH")
+    for n_strikes in strike_counts:
+        source.n_strikes = n_strikes
+        chains = [source.get_option_chain("BENCH", expiration)[0] for expiration in expirations]
+        rows = sum(len(chain) for chain in chains)
+        seconds, peak = measure(lambda: f.normalize_option_chain(expirations, chains), repeat)
+        results.append(result("normalize_chain", {"rows": rows}, seconds, rows, peak))
+    return results
+
+
+def bench_chain(strike_counts, spot_points, repeat):
+    results = []
+    for n_strikes in strike_counts:
+        calls_all, puts_all, spot = f.get_option_chains_spot("BENCH", source=SyntheticSource(n_strikes=n_strikes))
+        params = {"contracts": len(calls_all) + len(puts_all), "spot_points": spot_points}
+        evaluations = params["contracts"] * spot_points
+
+        def market_prices():
+            f.calculate_market_prices(0.5 * spot, 1.5 * spot, calls_all, puts_all, RISK_FREE_RATE, DIVIDEND_YIELD)
+
+        seconds, peak = measure(market_prices, repeat)
+        results.append(result("market_prices_chain", dict(params, spot_points=11), seconds,
+                              params["contracts"] * 11, peak))
+
+        def mispricing_cube():
+            f.calculate_mispricing_cube(0.5 * spot, 1.5 * spot, calls_all, 'C', RISK_FREE_RATE, DIVIDEND_YIELD,
+                                        n_spot=spot_points)
+            f.calculate_mispricing_cube(0.5 * spot, 1.5 * spot, puts_all, 'P', RISK_FREE_RATE, DIVIDEND_YIELD,
+                                        n_spot=spot_points)
+
+        seconds, peak = measure(mispricing_cube, repeat)
+        results.append(result("mispricing_cube_chain", params, seconds, evaluations, peak))
+    return results
+
+
+def bench_backends(sizes, repeat):
+    # Times bs_values on every available kernel backend and checks that they agree
+    backends = ['numpy'] + (['numba'] if pricing._numba_kernels() is not None else [])
+    selected = pricing._backend
+    results = []
+    try:
+        for n in sizes:
+            strikes, T, vols, _, _ = random_contracts(n)
+            reference = None
+            for backend in backends:
+                pricing.set_backend(backend)
+                values = pricing.bs_values(100.0, strikes, RISK_FREE_RATE, T, vols, DIVIDEND_YIELD)
+                reference = values if reference is None else reference
+                difference = max(float(np.max(np.abs(a - b))) for a, b in zip(values, reference))
+                if difference > 1e-9:
+                    raise AssertionError(f"The {backend} backend differs from numpy by {difference:.3g}.")
+
+                seconds, peak = measure(lambda: pricing.bs_values(100.0, strikes, RISK_FREE_RATE, T, vols,
+                                                                  DIVIDEND_YIELD), repeat)
+                results.append(dict(result("pricing_backend", {"backend": backend, "options": 2 * n}, seconds,
+                                           2 * n, peak), max_abs_difference_vs_numpy=difference))
+    finally:
+        pricing.set_backend(selected)
+    return results
+
+
+def bench_imports(modules, repeat):
+    # Cold import time of each module, in a fresh interpreter per run
+    results = []
+    for module in modules:
+        timings = []
+        for _ in range(repeat):
+            code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+            output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+            timings.append(float(output.stdout.strip().splitlines()[-1]))
+        results.append(result("import_time", {"module": module}, min(timings), 1, 0.0))
+    return results
+
+
+def result(name, params, seconds, operations, peak_mb):
+    return {
+        "benchmark": name,
+        "params": params,
+        "seconds": seconds,
+        "ops_per_second": operations / seconds if seconds > 0 else float("inf"),
+        "peak_memory_mb": peak_mb,
+    }
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results, baseline_path):
+    # Prints the speedup of every benchmark relative to a previous results file (> 1 is faster)
+    with open(baseline_path) as baseline_file:
+        baseline = {(r["benchmark"], json.dumps(r["params"], sort_keys=True)): r
+                    for r in json.load(baseline_file)["results"]}
+
+    print(f"\nComparison with {baseline_path}:")
+    for r in results:
+        old = baseline.get((r["benchmark"], json.dumps(r["params"], sort_keys=True)))
+        if old is not None:
+            print(f"  {r['benchmark']:<24} {json.dumps(r['params']):<48} {old['seconds'] / r['seconds']:6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pricing, IV and grid hot paths of functions.py")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and a single repeat")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        repeat, sizes, resolutions, strike_counts = 1, [1000, 100000], [11, 100, 500], [50, 200]
+    else:
+        repeat, sizes, resolutions, strike_counts = 3, [1000, 10000, 100000, 1000000], \
+            [11, 50, 100, 250, 500, 1000, 2000], [50, 200, 1000]
+
+    results = []
+    for section in (lambda: bench_imports(["pricing", "functions"], repeat), lambda: bench_pricing(sizes, repeat),
+                    lambda: bench_backends(sizes, repeat),
+                    lambda: bench_iv(sizes, repeat), lambda: bench_grid(resolutions, repeat),
+                    lambda: bench_lattice([11, 50, 100], 200, repeat),
+                    lambda: bench_portfolio([100, 1000, 5000], repeat),
+                    lambda: bench_normalize([50, 500], repeat),
+                    lambda: bench_chain(strike_counts, 100, repeat)):
+        for r in section():
+            print(f"{r['benchmark']:<24} {json.dumps(r['params']):<48} {r['seconds'] * 1000:10.2f} ms "
+                  f"{r['ops_per_second']:14.0f} ops/s {r['peak_memory_mb']:9.1f} MB")
+            results.append(r)
+
+    with open(args.output, "w") as output:
+        json.dump({"meta": metadata(), "results": results}, output, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
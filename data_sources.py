@@ -0,0 +1,103 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Option data sources for Get_Option_Chains_Spot
+# A source is any object with these three methods:
+#   get_spot(ticker_symbol) -> latest spot price
+#   get_expirations(ticker_symbol) -> expiration dates as 'YYYY-MM-DD' strings
+#   get_option_chain(ticker_symbol, expiration) -> (calls, puts) DataFrames with at least the columns
+#                                                  strike, lastPrice and impliedVolatility
+# and optionally a transient_errors tuple of source-specific exceptions worth retrying a request on
+
+
+class YFinanceSource:
+    # Live option data from Yahoo Finance (the default source)
+
+    def __init__(self):
+        # yfinance is only imported when this source is used
+        import yfinance as yf
+        self._yf = yf
+        # Throttled requests are retried like network errors (YFRateLimitError only exists in recent yfinance
+        # releases)
+        rate_limit_error = getattr(getattr(yf, "exceptions", None), "YFRateLimitError", None)
+        self.transient_errors = (rate_limit_error,) if rate_limit_error is not None else ()
+
+        # One yf.Ticker per symbol, so the expiration list fetched by get_expirations is reused by get_option_chain
+        self._tickers = {}
+        self._lock = threading.Lock()
+
+    def _ticker(self, ticker_symbol):
+        with self._lock:
+            if ticker_symbol not in self._tickers:
+                self._tickers[ticker_symbol] = self._yf.Ticker(ticker_symbol)
+            return self._tickers[ticker_symbol]
+
+    def get_spot(self, ticker_symbol):
+        history = self._ticker(ticker_symbol).history(period="1d")
+
+        # Check if the history DataFrame is empty
+        if history.empty:
+            raise ValueError(f"No historical data available for ticker {ticker_symbol}.")
+
+        return history["Close"].iloc[0]
+
+    def get_expirations(self, ticker_symbol):
+        return tuple(self._ticker(ticker_symbol).options)
+
+    def get_option_chain(self, ticker_symbol, expiration):
+        chain = self._ticker(ticker_symbol).option_chain(expiration)
+        return chain.calls, chain.puts
+
+
+class SyntheticSource:
+    # Deterministic local option chains for tests and benchmarks (no network)
+    # spot is the spot price of every ticker
+    # expiration_days are the expirations in days from today, n_strikes the number of strikes per expiration
+    # latency is an artificial delay in seconds added to every option chain request, to emulate a remote source
+
+    def __init__(self, spot=100.0, expiration_days=(7, 14, 30, 60, 90, 180, 365, 730), n_strikes=50,
+                 risk_free_rate=0.03, dividend_yield=0.0, latency=0.0, seed=0):
+        self.spot = spot
+        self.expiration_days = tuple(expiration_days)
+        self.n_strikes = n_strikes
+        self.risk_free_rate = risk_free_rate
+        self.dividend_yield = dividend_yield
+        self.latency = latency
+        self.seed = seed
+
+    def get_spot(self, ticker_symbol):
+        return self.spot
+
+    def get_expirations(self, ticker_symbol):
+        today = datetime.now().date()
+        return tuple((today + timedelta(days=days)).strftime("%Y-%m-%d") for days in self.expiration_days)
+
+    def get_option_chain(self, ticker_symbol, expiration):
+        from functions import calculate_time_to_expiration
+        from pricing import bs_values
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        # Seed from the request so repeated and concurrent calls return identical chains
+        rng = np.random.default_rng([self.seed, sum(map(ord, ticker_symbol)), sum(map(ord, expiration))])
+
+        strikes = np.round(np.linspace(0.5 * self.spot, 1.5 * self.spot, self.n_strikes), 2)
+        T = max(calculate_time_to_expiration(expiration), 1 / 365.0)
+
+        # Volatility smile in log-moneyness plus noise, and market prices scattered around the model prices
+        moneyness = np.log(strikes / self.spot)
+        iv = 0.2 + 0.4 * moneyness ** 2 + rng.normal(0.0, 0.01, size=(2, self.n_strikes))
+        iv = np.clip(iv, 0.05, None)
+        call, _ = bs_values(self.spot, strikes, self.risk_free_rate, T, iv[0], self.dividend_yield)
+        _, put = bs_values(self.spot, strikes, self.risk_free_rate, T, iv[1], self.dividend_yield)
+        noise = rng.normal(1.0, 0.02, size=(2, self.n_strikes))
+
+        calls = pd.DataFrame({"strike": strikes, "lastPrice": np.round(call * noise[0], 2), "impliedVolatility": iv[0]})
+        puts = pd.DataFrame({"strike": strikes, "lastPrice": np.round(put * noise[1], 2), "impliedVolatility": iv[1]})
+        return calls, puts
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+
+# Sorted expiration index over the calls and puts of an option chain, for the maturity selectors of main.py
+# Both chains are ordered by expiration once, so every year / month / day selector and the rows of one expiration
+# are answered with binary searches over sorted arrays instead of boolean masks over the whole chain
+
+
+class ExpiryIndex:
+    # calls_all and puts_all as returned by Get_Option_Chains_Spot (expiration as dates, or 'YYYY-MM-DD' strings
+    # for chains stored by older versions)
+
+    def __init__(self, calls_all, puts_all):
+        self.calls, call_dates = self._sorted(calls_all)
+        self.puts, put_dates = self._sorted(puts_all)
+        self._call_dates = call_dates
+        self._put_dates = put_dates
+
+        # Expirations listed in both chains, ascending
+        self.dates = np.intersect1d(call_dates, put_dates)
+        self._years = self.dates.astype('datetime64[Y]')
+        self._months = self.dates.astype('datetime64[M]')
+
+    @staticmethod
+    def _sorted(options):
+        # Chain ordered by expiration (stable, so rows keep their order within an expiration) and its dates
+        expiration = options["expiration"]
+        if isinstance(expiration.dtype, pd.CategoricalDtype):
+            # One conversion per expiration, spread over the rows through the category codes
+            categories = pd.to_datetime(expiration.cat.categories).to_numpy(dtype='datetime64[D]')
+            dates = categories[expiration.cat.codes.to_numpy()]
+        else:
+            dates = pd.to_datetime(expiration).to_numpy(dtype='datetime64[D]')
+        if dates.size and not (dates[1:] >= dates[:-1]).all():
+            order = np.argsort(dates, kind='stable')
+            options, dates = options.iloc[order].reset_index(drop=True), dates[order]
+        return options, dates
+
+    def __len__(self):
+        return len(self.dates)
+
+    def years(self):
+        # Years with an expiration, ascending
+        return [int(year) + 1970 for year in np.unique(self._years).astype(int)]
+
+    def months(self, year):
+        # Months of year with an expiration, ascending
+        year = np.datetime64(f"{int(year):04d}", 'Y')
+        months = self._months[np.searchsorted(self._years, year):np.searchsorted(self._years, year, side='right')]
+        return [int(month) % 12 + 1 for month in np.unique(months).astype(int)]
+
+    def days(self, year, month):
+        # Days of year-month with an expiration, ascending
+        month = np.datetime64(f"{int(year):04d}-{int(month):02d}", 'M')
+        dates = self.dates[np.searchsorted(self._months, month):np.searchsorted(self._months, month, side='right')]
+        return [int(day) + 1 for day in (dates - dates.astype('datetime64[M]')).astype(int)]
+
+    def chains(self, expiration):
+        # (calls, puts) of one expiration, as slices of the sorted chains
+        date = np.datetime64(pd.Timestamp(expiration).date(), 'D')
+        return (self.calls.iloc[self._rows(self._call_dates, date)],
+                self.puts.iloc[self._rows(self._put_dates, date)])
+
+    @staticmethod
+    def _rows(dates, date):
+        return slice(np.searchsorted(dates, date), np.searchsorted(dates, date, side='right'))
@@ -1,162 +1,154 @@
-import yfinance as yf
 import numpy as np
-from scipy.stats import norm
-import scipy as sq
 import pandas as pd
-import seaborn as sns
-from matplotlib import pyplot as plt
-import streamlit as st
 from datetime import datetime
+import logging
 import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+import perf
 
+# Core pricing lives in pricing.py (NumPy and scipy.special only) and is re-exported here
+from pricing import (  # noqa: F401
+    BACKENDS, GREEKS, IV_BRACKETED, IV_FAILED, IV_NEWTON, american_values, bs_greeks, bs_values,
+    calculate_iv_call_put, call_bs_value, call_iv, call_iv_obj_function, early_exercise_premium, get_backend,
+    grid_axis, grid_labels, implied_volatility, option_grid, put_bs_value, put_iv, put_iv_obj_function, set_backend)
+from portfolio import portfolio_pnl
 
-import time
-import yfinance as yf
-import pandas as pd
-
-def get_option_chains_spot(ticker_symbol, retries=3, delay=2):
-    # Fetch the ticker data
-    ticker = yf.Ticker(ticker_symbol)
-    for attempt in range(retries):
-        try:
-            # Get the historical spot price
-            history = ticker.history(period="1d")
-
-            # Check if the history DataFrame is empty
-            if history.empty:
-                raise ValueError(f"No historical data available for ticker {ticker_symbol}.")
+# yfinance, seaborn, matplotlib and streamlit are imported on first use by the data-fetch and plotting functions
 
-            # Get the spot price from the history DataFrame
-            spot_price = history["Close"].iloc[0]
+logger = logging.getLogger(__name__)
 
-            # Get expiration dates
-            expiration_dates = ticker.options  # Expiration dates
+# Errors a fetch is retried on: network and HTTP failures (requests, curl_cffi and urllib errors derive from
+# OSError) and the empty or truncated responses the sources report as ValueError / IndexError; a source may add
+# its own through a transient_errors attribute (see data_sources.py)
+RETRY_ERRORS = (OSError, ValueError, IndexError)
 
-            # Fetch call and put options for each expiration date
-            calls_dict = {date: ticker.option_chain(date).calls for date in expiration_dates}
-            puts_dict = {date: ticker.option_chain(date).puts for date in expiration_dates}
 
-            # Add expiration column to each DataFrame in calls_dict and puts_dict
-            for date, df in calls_dict.items():
-                df['expiration'] = date
+def _plotting():
+    # Plotting dependencies, imported when the first heatmap is drawn
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+    import streamlit as st
+    return sns, plt, st
 
-            for date, df in puts_dict.items():
-                df['expiration'] = date
 
-            # Concatenate all DataFrames from calls_dict and puts_dict
-            calls_all = pd.concat(calls_dict.values(), ignore_index=True)
-            puts_all = pd.concat(puts_dict.values(), ignore_index=True)
-
-            # For calls_all DataFrame
-            calls_all = calls_all[["strike", "lastPrice", "impliedVolatility", "expiration"]]
-            calls_all["time_to_expiration"] = calls_all["expiration"].apply(calculate_time_to_expiration)
-            calls_all = calls_all[calls_all["time_to_expiration"] > 0.0]
-            calls_all = calls_all.reset_index(drop=True)
-
-            # For puts_all DataFrame
-            puts_all = puts_all[["strike", "lastPrice", "impliedVolatility", "expiration"]]
-            puts_all["time_to_expiration"] = puts_all["expiration"].apply(calculate_time_to_expiration)
-            puts_all = puts_all[puts_all["time_to_expiration"] > 0.0]
-            puts_all = puts_all.reset_index(drop=True)
-
-            # If successful, return the data
-            return calls_all, puts_all, spot_price
-
-        except (IndexError, ValueError) as e:
-            # Print a warning and retry after a delay
-            print(f"Attempt {attempt + 1} failed with error: {e} - Retrying after {delay} seconds...")
+def _with_retries(fetch, description, retries, delay, errors=RETRY_ERRORS):
+    # Calls fetch() until it succeeds, at most retries times, sleeping delay seconds between attempts
+    # Only the exception types in errors are retried, any other exception propagates
+    for attempt in range(retries):
+        try:
+            return fetch()
+        except errors as e:
+            # Log a warning and retry after a delay
+            logger.warning("Attempt %d for %s failed with error: %s - Retrying after %s seconds...",
+                           attempt + 1, description, e, delay)
             time.sleep(delay)
 
-    # If all retries fail, raise an error
-    raise ValueError(f"Failed to get spot price and options data for ticker {ticker_symbol} after {retries} attempts.")
-
-
-
-def call_bs_value(S, X, r, T, v, q):
-    # Calculates the value of a call option (Black-Scholes formula for call options with dividends)
-    # S is the share price at time T
-    # X is the strike price
-    # r is the risk-free interest rate
-    # T is the time to maturity in years (days/365)
-    # v is the volatility
-    # q is the dividend yield
-    d_1 = (np.log(S / X) + (r - q + v ** 2 * 0.5) * T) / (v * np.sqrt(T))
-    d_2 = d_1 - v * np.sqrt(T)
-    return S * np.exp(-q * T) * norm.cdf(d_1) - X * np.exp(-r * T) * norm.cdf(d_2)
-
-
-def call_iv_obj_function(S, X, r, T, v, q, call_price):
-    # Objective function which sets market and model prices equal to zero (Function needed for Call_IV)
-    # The parameters are explained in the Call_BS_Value function
-    return call_price - call_bs_value(S, X, r, T, v, q)
-
-
-def call_iv(S, X, r, T, call_price, q, a=-2, b=2, xtol=0.000001):
-    # Calculates the implied volatility for a call option with Brent's method
-    # The first four parameters are explained in the Call_BS_Value function
-    # Call_Price is the price of the call option
-    # q is the dividend yield
-    # Last three variables are needed for Brent's method
-    _S, _X, _r, _t, _call_Price, _q = S, X, r, T, call_price, q
-
-    def fcn(v):
-        return call_iv_obj_function(_S, _X, _r, _t, v, _q, _call_Price)
-
+    raise ValueError(f"Failed to get {description} after {retries} attempts.")
+
+
+@perf.timed()
+def get_option_chains_spot(ticker_symbol, retries=3, delay=2, source=None, max_workers=8, timeout=30):
+    # Fetches the spot price and the calls and puts of every expiration date of a ticker
+    # source provides the data (see data_sources.py), Yahoo Finance by default
+    # Each expiration is fetched once, in parallel on a pool of at most max_workers threads
+    # Every request is retried up to retries times with delay seconds in between; the expirations still missing
+    # timeout seconds after the requests were sent are skipped
+    if source is None:
+        from data_sources import YFinanceSource
+        source = YFinanceSource()
+    errors = RETRY_ERRORS + tuple(getattr(source, "transient_errors", ()))
+
+    # Get the spot price and the expiration dates
+    spot_price = _with_retries(perf.timed('fetch_spot')(lambda: source.get_spot(ticker_symbol)),
+                               f"spot price for ticker {ticker_symbol}", retries, delay, errors)
+    expiration_dates = _with_retries(perf.timed('fetch_expirations')(lambda: source.get_expirations(ticker_symbol)),
+                                     f"expiration dates for ticker {ticker_symbol}", retries, delay, errors)
+    if len(expiration_dates) == 0:
+        raise ValueError(f"No options data available for ticker {ticker_symbol}.")
+
+    # Fetch call and put options for each expiration date, one request per date (timed into this thread's recorder)
+    fetch_option_chain = perf.propagate(perf.timed('fetch_option_chain')(source.get_option_chain))
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(expiration_dates))))
+    futures = {
+        date: pool.submit(_with_retries, partial(fetch_option_chain, ticker_symbol, date),
+                          f"options data for ticker {ticker_symbol} expiring {date}", retries, delay, errors)
+        for date in expiration_dates
+    }
+
+    dates, calls_list, puts_list = [], [], []
     try:
-        result = sq.optimize.brentq(fcn, a=a, b=b, xtol=xtol)
-        return np.nan if result <= xtol else result
-    except ValueError:
-        return np.nan
-
-
-def put_bs_value(S, X, r, T, v, q):
-    # Calculates the value of a put option (Black-Scholes formula for put options with dividends)
-    # The parameters are explained in the Call_BS_Value function
-    d_1 = (np.log(S / X) + (r - q + v ** 2 * 0.5) * T) / (v * np.sqrt(T))
-    d_2 = d_1 - v * np.sqrt(T)
-    return X * np.exp(-r * T) * norm.cdf(-d_2) - S * np.exp(-q * T) * norm.cdf(-d_1)
-
-
-def put_iv_obj_function(S, X, r, T, v, q, put_price):
-    # Objective function which sets market and model prices equal to zero (Function needed for Put_IV)
-    # The parameters are explained in the Call_BS_Value function
-    return put_price - put_bs_value(S, X, r, T, v, q)
-
-
-def put_iv(S, X, r, T, put_price, q, a=-2, b=2, xtol=0.000001):
-    # Calculates the implied volatility for a put option with Brent's method
-    # The first four parameters are explained in the Call_BS_Value function
-    # Put_Price is the price of the put option
-    # q is the dividend yield
-    # Last three variables are needed for Brent's method
-    _S, _X, _r, _t, _Put_Price, _q = S, X, r, T, put_price, q
-
-    def fcn(v):
-        return put_iv_obj_function(_S, _X, _r, _t, v, _q, _Put_Price)
-
-    try:
-        result = sq.optimize.brentq(fcn, a=a, b=b, xtol=xtol)
-        return np.nan if result <= xtol else result
-    except ValueError:
-        return np.nan
-
-
-def calculate_iv_call_put(S, X, r, T, option_price, put_or_call, q):
-    # This is a general function witch summarizes Call_IV and Put_IV (delivers the same results)
-    # Can be used for a Lambda function within Pandas
-    # The first four parameters are explained in the Call_BS_Value function
-    # Put_or_Call:
-    # 'C' returns the implied volatility of a call
-    # 'P' returns the implied volatility of a put
-    # Option_Price is the price of the option.
-    # q is the dividend yield
-
-    if put_or_call == 'C':
-        return call_iv(S, X, r, T, option_price, q)
-    if put_or_call == 'P':
-        return put_iv(S, X, r, T, option_price, q)
-    else:
-        return 'Neither call or put'
+        # One deadline for the whole chain, rather than timeout seconds per expiration
+        _, pending = wait(futures.values(), timeout=timeout)
+        for date, future in futures.items():
+            if future in pending:
+                logger.warning("Skipping expiration %s for ticker %s: timed out after %s seconds",
+                               date, ticker_symbol, timeout)
+                continue
+            try:
+                calls, puts = future.result()
+            except ValueError as e:
+                logger.warning("Skipping expiration %s for ticker %s: %s", date, ticker_symbol, str(e) or 'failed')
+                continue
+
+            dates.append(date)
+            calls_list.append(calls)
+            puts_list.append(puts)
+    finally:
+        # Do not wait on requests that timed out
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if not calls_list:
+        raise ValueError(f"Failed to get options data for any expiration of ticker {ticker_symbol}.")
+
+    with perf.stage('normalize_chains'):
+        calls_all = normalize_option_chain(dates, calls_list)
+        puts_all = normalize_option_chain(dates, puts_list)
+
+    return calls_all, puts_all, spot_price
+
+
+# Columns of a normalized option chain and their dtypes; strike stays float64 as it is a lookup key and a heatmap
+# label, the other floats are float32 and cast back to float64 by the pricing kernels (see _column)
+CHAIN_DTYPES = {
+    "strike": np.float64,
+    "lastPrice": np.float32,
+    "impliedVolatility": np.float32,
+    "expiration": "category",
+    "time_to_expiration": np.float32,
+}
+
+
+def normalize_option_chain(expirations, chains, now=None):
+    # Builds one compact option chain from the per-expiration chains of a source in a single vectorized pass
+    # expirations are 'YYYY-MM-DD' strings and chains the matching DataFrames (strike, lastPrice and
+    # impliedVolatility columns); now is the reference time (the current time by default)
+    # Each expiration is parsed once and its time to expiration computed once, as in Calculate_Time_To_Expiration
+    # (whole days to expiration / 365), then spread over its rows; expired contracts are dropped
+    # time_to_expiration is stored as float32, so it differs from Calculate_Time_To_Expiration by up to a relative
+    # 6e-8 (float32 rounding; under 5e-7 years, about 15 seconds, for expirations within 10 years)
+    # expiration is a categorical of dates (one category per expiration)
+    dates = pd.DatetimeIndex(pd.to_datetime(list(expirations), format="%Y-%m-%d"))
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    time_to_expiration = np.floor((dates - now) / pd.Timedelta(days=1)).to_numpy() / 365.0
+
+    codes = np.repeat(np.arange(len(dates)), [len(chain) for chain in chains])
+    keep = time_to_expiration[codes] > 0.0
+    codes = codes[keep]
+
+    def column(name):
+        if not chains:
+            return np.empty(0)
+        return np.concatenate([chain[name].to_numpy(dtype=np.float64) for chain in chains])[keep]
+
+    return pd.DataFrame({
+        "strike": column("strike"),
+        "lastPrice": column("lastPrice").astype(np.float32),
+        "impliedVolatility": column("impliedVolatility").astype(np.float32),
+        "expiration": pd.Categorical.from_codes(codes, categories=dates).remove_unused_categories(),
+        "time_to_expiration": time_to_expiration[codes].astype(np.float32),
+    })
 
 
 def calculate_time_to_expiration(expiration_date_str: str) -> float:
@@ -184,29 +176,33 @@ def calculate_time_to_expiration(expiration_date_str: str) -> float:
     return T
 
 
-def calculate_option_values(min_spot, max_spot, min_vol, max_vol, strike_price, risk_free_rate, time_to_maturity, dividend_yield, purchase_price):
-    spot_interval = np.round(np.linspace(min_spot, max_spot, 11), 2)
-    vol_interval = np.round(np.linspace(min_vol, max_vol, 11), 2)
-
-    call_values = np.zeros((len(vol_interval), len(spot_interval)))
-    put_values = np.zeros((len(vol_interval), len(spot_interval)))
+@perf.timed()
+def calculate_option_values(min_spot, max_spot, min_vol, max_vol, strike_price, risk_free_rate, time_to_maturity,
+                            dividend_yield, purchase_price, n_spot=11, n_vol=11, cache=None):
+    # Prices the whole vol x spot grid in a single broadcast pass (rows are volatilities, columns are spots)
+    # n_spot and n_vol set the grid resolution
+    # cache is an optional GridCache (see grid_cache.py) that memoizes the price grids across calls
+    spot_interval, vol_interval = option_grid(min_spot, max_spot, min_vol, max_vol, n_spot, n_vol)
 
-    call_pnl = np.zeros((len(vol_interval), len(spot_interval)))
-    put_pnl = np.zeros((len(vol_interval), len(spot_interval)))
+    if cache is not None:
+        call_values, put_values = cache.price_grid(spot_interval, vol_interval, strike_price, risk_free_rate,
+                                                   time_to_maturity, dividend_yield)
+    else:
+        call_values, put_values = bs_values(spot_interval[np.newaxis, :], strike_price, risk_free_rate,
+                                            time_to_maturity, vol_interval[:, np.newaxis], dividend_yield)
 
-    for i, spot in enumerate(spot_interval):
-        for j, vol in enumerate(vol_interval):
-            call_values[j, i] = call_bs_value(spot, strike_price, risk_free_rate, time_to_maturity, vol, dividend_yield)
-            put_values[j, i] = put_bs_value(spot, strike_price, risk_free_rate, time_to_maturity, vol, dividend_yield)
+    # P&L grids are the price grids shifted by the purchase price
+    call_pnl = call_values - purchase_price
+    put_pnl = put_values - purchase_price
 
-            call_pnl[j, i] = call_values[j, i] - purchase_price
-            put_pnl[j, i] = put_values[j, i] - purchase_price
+    spot_labels = grid_labels(spot_interval)
+    vol_labels = grid_labels(vol_interval)
 
-    call_df = pd.DataFrame(call_values, index=vol_interval, columns=spot_interval)
-    put_df = pd.DataFrame(put_values, index=vol_interval, columns=spot_interval)
+    call_df = pd.DataFrame(call_values, index=vol_labels, columns=spot_labels)
+    put_df = pd.DataFrame(put_values, index=vol_labels, columns=spot_labels)
 
-    call_pnl_df = pd.DataFrame(call_pnl, index=vol_interval, columns=spot_interval)
-    put_pnl_df = pd.DataFrame(put_pnl, index=vol_interval, columns=spot_interval)
+    call_pnl_df = pd.DataFrame(call_pnl, index=vol_labels, columns=spot_labels)
+    put_pnl_df = pd.DataFrame(put_pnl, index=vol_labels, columns=spot_labels)
 
     call_df = call_df.round(2)
     put_df = put_df.round(2)
@@ -217,45 +213,238 @@ def calculate_option_values(min_spot, max_spot, min_vol, max_vol, strike_price,
     return call_df, put_df, call_pnl_df, put_pnl_df
 
 
-def calculate_market_prices(min_spot, max_spot, call_datapoints, put_datapoints, risk_free_rate, dividend_yield):
-    spot_interval = np.round(np.linspace(min_spot, max_spot, 11), 2)
+# Most cells (maturities x vols x spots) of a time decay cube, about 80 MB for the call and put cubes together
+TIME_DECAY_MAX_CELLS = 10_000_000
+
+
+@perf.timed()
+def calculate_time_decay_cube(min_spot, max_spot, min_vol, max_vol, strike_price, risk_free_rate, max_maturity,
+                              dividend_yield, n_spot=11, n_vol=11, n_time=30, min_maturity=1 / 365.0,
+                              chunk_cells=4_000_000):
+    # Prices calls and puts over a maturity x vol x spot cube, so the decay of the surface can be scrubbed through
+    # without any further pricing
+    # Maturities run from max_maturity down to min_maturity (one day by default) in n_time steps
+    # The cube is filled chunk_cells cells at a time and stored as float32
+    # Returns (time_interval, spot_interval, vol_interval, call_cube, put_cube), cube[t, i, j] being the value at
+    # maturity t, volatility i and spot j
+    # Cubes of more than TIME_DECAY_MAX_CELLS cells are refused
+    if n_time * n_vol * n_spot > TIME_DECAY_MAX_CELLS:
+        raise ValueError(f"A {n_time} x {n_vol} x {n_spot} time decay cube exceeds {TIME_DECAY_MAX_CELLS:,} cells, "
+                         f"use fewer maturity steps or a coarser grid.")
+    spot_interval, vol_interval = option_grid(min_spot, max_spot, min_vol, max_vol, n_spot, n_vol)
+    time_interval = np.linspace(max_maturity, min(min_maturity, max_maturity), n_time)
+
+    call_cube = np.empty((n_time, n_vol, n_spot), dtype=np.float32)
+    put_cube = np.empty((n_time, n_vol, n_spot), dtype=np.float32)
+
+    step = max(1, chunk_cells // (n_vol * n_spot))
+    for start in range(0, n_time, step):
+        times = time_interval[start:start + step, np.newaxis, np.newaxis]
+        call_cube[start:start + step], put_cube[start:start + step] = bs_values(
+            spot_interval[np.newaxis, np.newaxis, :], strike_price, risk_free_rate, times,
+            vol_interval[np.newaxis, :, np.newaxis], dividend_yield)
+
+    return time_interval, spot_interval, vol_interval, call_cube, put_cube
+
+
+def time_decay_slice(time_decay_cube, index):
+    # Call and put price DataFrames at one maturity of a Calculate_Time_Decay_Cube result, without any repricing
+    _, spot_interval, vol_interval, call_cube, put_cube = time_decay_cube
+    spot_labels = grid_labels(spot_interval)
+    vol_labels = grid_labels(vol_interval)
+
+    call_df = pd.DataFrame(call_cube[index], index=vol_labels, columns=spot_labels).round(2)
+    put_df = pd.DataFrame(put_cube[index], index=vol_labels, columns=spot_labels).round(2)
+    return call_df, put_df
+
 
-    call_vol_interval = call_datapoints["impliedVolatility"].round(2)
-    put_vol_interval = put_datapoints["impliedVolatility"].round(2)
+@perf.timed()
+def calculate_greek_values(min_spot, max_spot, min_vol, max_vol, strike_price, risk_free_rate, time_to_maturity,
+                           dividend_yield, n_spot=11, n_vol=11):
+    # Calculates every Greek over the vol x spot grid of Calculate_Option_Values in a single broadcast pass
+    # Returns a dict mapping each name in GREEKS to a (call_df, put_df) pair
+    spot_interval, vol_interval = option_grid(min_spot, max_spot, min_vol, max_vol, n_spot, n_vol)
 
-    call_values = np.zeros((len(call_vol_interval), len(spot_interval)))
-    put_values = np.zeros((len(put_vol_interval), len(spot_interval)))
+    greeks = bs_greeks(spot_interval[np.newaxis, :], strike_price, risk_free_rate, time_to_maturity,
+                       vol_interval[:, np.newaxis], dividend_yield)
 
-    for i, spot in enumerate(spot_interval):
-        for row in call_datapoints.itertuples():
-            call_values[row.Index, i] = call_bs_value(S=spot, X=row.strike, r=risk_free_rate, T=row.time_to_expiration,
-                                                      v=row.impliedVolatility, q=dividend_yield) - row.lastPrice
+    spot_labels = grid_labels(spot_interval)
+    vol_labels = grid_labels(vol_interval)
 
-    for i, spot in enumerate(spot_interval):
-        for row in put_datapoints.itertuples():
-            put_values[row.Index, i] = put_bs_value(S=spot, X=row.strike, r=risk_free_rate, T=row.time_to_expiration,
-                                                    v=row.impliedVolatility, q=dividend_yield) - row.lastPrice
+    return {
+        greek: (pd.DataFrame(call, index=vol_labels, columns=spot_labels),
+                pd.DataFrame(put, index=vol_labels, columns=spot_labels))
+        for greek, (call, put) in greeks.items()
+    }
 
-    call_df = pd.DataFrame(call_values, index=call_vol_interval, columns=spot_interval)
-    put_df = pd.DataFrame(put_values, index=put_vol_interval, columns=spot_interval)
 
+# Largest early exercise premium grid (points per axis), and the most lattice node updates
+# (cells x steps^2 / 2, about 6 s here) a single premium grid may take
+EARLY_EXERCISE_MAX_RESOLUTION = 100
+LATTICE_WORK_BUDGET = 400_000_000
+
+
+def max_lattice_steps(n_spot, n_vol, budget=LATTICE_WORK_BUDGET):
+    # Most lattice steps an n_vol x n_spot premium grid can use within budget node updates
+    return int(np.sqrt(2 * budget / (n_spot * n_vol)))
+
+
+@perf.timed()
+def calculate_early_exercise_premium(min_spot, max_spot, min_vol, max_vol, strike_price, risk_free_rate,
+                                     time_to_maturity, dividend_yield, n_spot=11, n_vol=11, steps=200):
+    # Early exercise premium (American minus European value) of calls and puts over the vol x spot grid of
+    # Calculate_Option_Values, every cell rolled back in one batched binomial lattice with steps time steps
+    # The cost grows with n_spot x n_vol x steps^2; grids over LATTICE_WORK_BUDGET are refused
+    if steps > max_lattice_steps(n_spot, n_vol):
+        raise ValueError(f"{steps} lattice steps over a {n_vol} x {n_spot} grid exceed the lattice work budget, "
+                         f"use at most {max_lattice_steps(n_spot, n_vol)} steps or a coarser grid.")
+    spot_interval, vol_interval = option_grid(min_spot, max_spot, min_vol, max_vol, n_spot, n_vol)
+
+    call_premium, put_premium = early_exercise_premium(spot_interval[np.newaxis, :], strike_price, risk_free_rate,
+                                                       time_to_maturity, vol_interval[:, np.newaxis],
+                                                       dividend_yield, steps=steps)
+
+    spot_labels = grid_labels(spot_interval)
+    vol_labels = grid_labels(vol_interval)
+
+    call_df = pd.DataFrame(call_premium, index=vol_labels, columns=spot_labels).round(2)
+    put_df = pd.DataFrame(put_premium, index=vol_labels, columns=spot_labels).round(2)
     return call_df, put_df
 
 
-def market_heatmaps(call_df, put_df):
+@perf.timed()
+def calculate_portfolio_pnl(legs, min_spot, max_spot, min_vol_shift, max_vol_shift, risk_free_rate, dividend_yield,
+                            time_shift=0.0, n_spot=11, n_vol=11, memory_budget_mb=256):
+    # P&L of a book of option legs (see portfolio.py) over a vol shift x spot grid, time_shift years from now
+    # Returns (total_df, call_df, put_df): the whole book, its call legs and its put legs
+    spot_interval, vol_shifts = option_grid(min_spot, max_spot, min_vol_shift, max_vol_shift, n_spot, n_vol)
+    pnl = portfolio_pnl(legs, spot_interval, vol_shifts, time_shift, risk_free_rate, dividend_yield,
+                        memory_budget_mb=memory_budget_mb)
+
+    spot_labels = grid_labels(spot_interval)
+    vol_labels = grid_labels(vol_shifts)
+
+    return tuple(pd.DataFrame(pnl[part][0], index=vol_labels, columns=spot_labels).round(2)
+                 for part in ('total', 'call', 'put'))
+
+
+@perf.timed()
+def calculate_market_prices(min_spot, max_spot, call_datapoints, put_datapoints, risk_free_rate, dividend_yield):
+    # Theoretical minus market price of the given contracts over a spot grid, one broadcast pass per option type
+    spot_interval = grid_axis(min_spot, max_spot, 11)
+
+    call_vol_interval = call_datapoints["impliedVolatility"].astype(np.float64).round(2)
+    put_vol_interval = put_datapoints["impliedVolatility"].astype(np.float64).round(2)
+
+    call_values = call_bs_value(S=spot_interval[np.newaxis, :], X=_column(call_datapoints, "strike"), r=risk_free_rate,
+                                T=_column(call_datapoints, "time_to_expiration"),
+                                v=_column(call_datapoints, "impliedVolatility"),
+                                q=dividend_yield) - _column(call_datapoints, "lastPrice")
+    put_values = put_bs_value(S=spot_interval[np.newaxis, :], X=_column(put_datapoints, "strike"), r=risk_free_rate,
+                              T=_column(put_datapoints, "time_to_expiration"),
+                              v=_column(put_datapoints, "impliedVolatility"),
+                              q=dividend_yield) - _column(put_datapoints, "lastPrice")
+
+    call_df = pd.DataFrame(call_values, index=call_vol_interval, columns=grid_labels(spot_interval))
+    put_df = pd.DataFrame(put_values, index=put_vol_interval, columns=grid_labels(spot_interval))
+
+    return call_df, put_df
+
+
+def _column(options, name):
+    # Column of an option chain as a float64 column vector, ready to broadcast against a spot row
+    return options[name].to_numpy(dtype=np.float64)[:, np.newaxis]
+
+
+@perf.timed()
+def calculate_mispricing_cube(min_spot, max_spot, options, put_or_call, risk_free_rate, dividend_yield, n_spot=11,
+                              chunk_size=4096, surface=None):
+    # Theoretical minus market price of every contract of a chain (all strikes, all expirations) over a spot grid
+    # options is calls_all or puts_all from Get_Option_Chains_Spot and Put_or_Call is 'C' or 'P' accordingly
+    # surface is an optional IVSurface (see iv_surface.py); when given, contracts are priced at the smoothed surface
+    # volatility instead of their own quoted implied volatility
+    # Contracts are priced chunk_size at a time, which bounds the temporaries to chunk_size x n_spot values
+    # Returns (strikes, expirations, spot_interval, cube) where cube[i, j, k] is the mispricing of strike i at
+    # expiration j for spot k (NaN where the chain has no such contract)
+    spot_interval = grid_axis(min_spot, max_spot, n_spot)
+    value = call_bs_value if put_or_call == 'C' else put_bs_value
+
+    strikes, strike_index = np.unique(options["strike"].to_numpy(), return_inverse=True)
+    expirations, expiry_index = np.unique(options["expiration"].to_numpy(), return_inverse=True)
+    cube = np.full((len(strikes), len(expirations), n_spot), np.nan)
+
+    X = _column(options, "strike")
+    T = _column(options, "time_to_expiration")
+    v = _column(options, "impliedVolatility") if surface is None else surface.implied_volatility(X, T)
+    market = _column(options, "lastPrice")
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(options), chunk_size):
+            rows = slice(start, start + chunk_size)
+            cube[strike_index[rows], expiry_index[rows]] = value(spot_interval[np.newaxis, :], X[rows], risk_free_rate,
+                                                                 T[rows], v[rows], dividend_yield) - market[rows]
+
+    return strikes, expirations, spot_interval, cube
+
+
+@perf.timed()
+def mispricing_view(strikes, expirations, spot_interval, cube, expiration=None):
+    # Strike x spot mispricing DataFrame read from a Calculate_Mispricing_Cube result without any repricing
+    # With an expiration the cube is sliced at that date, otherwise it is averaged over all expirations
+    # Strikes without any contract in the view are dropped
+    if expiration is None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            values = np.nanmean(cube, axis=1)
+    else:
+        values = cube[:, pd.Index(expirations).get_loc(expiration), :]
+
+    df = pd.DataFrame(values, index=strikes, columns=grid_labels(spot_interval))
+    return df.dropna(how='all')
+
+
+# Largest heatmap (in cells) drawn with per-cell value annotations; bigger ones are drawn as a single image
+ANNOT_MAX_CELLS = 400
+# Maximum number of tick labels per axis on image heatmaps
+MAX_TICK_LABELS = 12
+
+
+@perf.timed()
+def draw_heatmap(df, ax, cmap, fmt=".2f"):
+    # Draws a DataFrame as a heatmap on ax, with a colorbar
+    # Small grids are drawn with seaborn and every cell annotated with its value
+    # Above ANNOT_MAX_CELLS the values are pushed as one color-mapped image without annotations and with
+    # downsampled tick labels, which keeps the render time flat as the grid grows
+    sns, _, _ = _plotting()
+    if df.size <= ANNOT_MAX_CELLS:
+        sns.heatmap(df, ax=ax, cmap=cmap, annot=True, cbar=True, fmt=fmt)
+        return
+
+    image = ax.imshow(df.to_numpy(dtype=float), cmap=cmap, aspect='auto', interpolation='nearest')
+    ax.figure.colorbar(image, ax=ax)
+
+    rows = np.unique(np.linspace(0, df.shape[0] - 1, min(df.shape[0], MAX_TICK_LABELS)).astype(int))
+    cols = np.unique(np.linspace(0, df.shape[1] - 1, min(df.shape[1], MAX_TICK_LABELS)).astype(int))
+    ax.set_yticks(rows, [f"{label:.2f}" for label in df.index[rows]])
+    ax.set_xticks(cols, [f"{label:.2f}" for label in df.columns[cols]], rotation=90)
+
+
+@perf.timed()
+def market_heatmaps(call_df, put_df, ylabel='Volatility'):
+    sns, plt, st = _plotting()
     fig, axs = plt.subplots(1, 2, figsize=(20, 10))
 
     # Plot Call Prices Heatmap
-    sns.heatmap(call_df, ax=axs[0], cmap='RdBu', annot=True, cbar=True, fmt=".2f")
+    draw_heatmap(call_df, ax=axs[0], cmap='RdBu', fmt=".2f")
     axs[0].set_title('Call Mis-pricing')
     axs[0].set_xlabel('Spot Price')
-    axs[0].set_ylabel('Volatility')
+    axs[0].set_ylabel(ylabel)
 
     # Plot Put Prices Heatmap
-    sns.heatmap(put_df, ax=axs[1], cmap='RdBu', annot=True, cbar=True, fmt=".2f")
+    draw_heatmap(put_df, ax=axs[1], cmap='RdBu', fmt=".2f")
     axs[1].set_title('Put Mispricing')
     axs[1].set_xlabel('Spot Price')
-    axs[1].set_ylabel('Volatility')
+    axs[1].set_ylabel(ylabel)
 
     handles = [
         plt.Line2D([0], [0], color='blue', label='Undervalued (Theoretical > Market)'),
@@ -265,26 +454,78 @@ def market_heatmaps(call_df, put_df):
     fig.legend(handles=handles, loc='upper center', bbox_to_anchor=(0.5, 1.1), ncol=3,
                fontsize=22, markerscale=4, frameon=True)
 
-    plt.tight_layout()
-    st.pyplot(fig)
+    with perf.stage('render'):
+        plt.tight_layout()
+        st.pyplot(fig)
+    # Release the figure, reruns and the time decay playback draw a new one every time
+    plt.close(fig)
+
+
+@perf.timed()
+def greek_heatmaps(greek, call_df, put_df):
+    sns, plt, st = _plotting()
+    fig, axs = plt.subplots(1, 2, figsize=(20, 10))
+
+    # Plot Call and Put Greeks
+    draw_heatmap(call_df, ax=axs[0], cmap='viridis', fmt=".3f")
+    axs[0].set_title(f'CALL {greek} Heatmap')
+    axs[0].set_xlabel('Spot Price')
+    axs[0].set_ylabel('Volatility')
+
+    draw_heatmap(put_df, ax=axs[1], cmap='viridis', fmt=".3f")
+    axs[1].set_title(f'PUT {greek} Heatmap')
+    axs[1].set_xlabel('Spot Price')
+    axs[1].set_ylabel('Volatility')
+
+    handles = [
+        plt.Line2D([0], [0], color='purple', label=f'Low {greek}'),
+        plt.Line2D([0], [0], color='green', label=f'Moderate {greek}'),
+        plt.Line2D([0], [0], color='yellow', label=f'High {greek}')
+    ]
+    fig.legend(handles=handles, loc='upper center', bbox_to_anchor=(0.5, 1.1), ncol=3,
+               fontsize=22, markerscale=4, frameon=True)
+
+    with perf.stage('render'):
+        plt.tight_layout()
+        st.pyplot(fig)
+    plt.close(fig)
 
 
-def plot_heatmaps(mode, call_df, put_df, call_pnl_df, put_pnl_df):
+@perf.timed()
+def portfolio_heatmap(total_df, ylabel='Volatility Shift'):
+    # Book P&L of calculate_portfolio_pnl over the whole grid, on one full-width heatmap
+    sns, plt, st = _plotting()
+    fig, ax = plt.subplots(figsize=(20, 8))
+
+    draw_heatmap(total_df, ax=ax, cmap='RdYlGn', fmt=".2f")
+    ax.set_title('BOOK P&L')
+    ax.set_xlabel('Spot Price')
+    ax.set_ylabel(ylabel)
+
+    with perf.stage('render'):
+        plt.tight_layout()
+        st.pyplot(fig)
+    plt.close(fig)
+
+
+@perf.timed()
+def plot_heatmaps(mode, call_df, put_df, call_pnl_df, put_pnl_df, ylabel='Volatility'):
+    sns, plt, st = _plotting()
     fig, axs = plt.subplots(1, 2, figsize=(20, 10))
 
     if mode == 'Pricing':
         # Plot Call and Put Prices
-        sns.heatmap(call_df, ax=axs[0], cmap='viridis', annot=True, cbar=True, fmt=".2f")
+        draw_heatmap(call_df, ax=axs[0], cmap='viridis', fmt=".2f")
         axs[0].set_facecolor('#f5f5f5')
         axs[0].set_title('CALL prices Heatmap')
         axs[0].set_xlabel('Spot Price')
-        axs[0].set_ylabel('Volatility')
+        axs[0].set_ylabel(ylabel)
 
-        sns.heatmap(put_df, ax=axs[1], cmap='viridis', annot=True, cbar=True, fmt=".2f")
+        draw_heatmap(put_df, ax=axs[1], cmap='viridis', fmt=".2f")
         axs[1].set_facecolor('#f5f5f5')
         axs[1].set_title('PUT prices Heatmap')
         axs[1].set_xlabel('Spot Price')
-        axs[1].set_ylabel('Volatility')
+        axs[1].set_ylabel(ylabel)
 
         # Add Legend for Pricing Mode
         handles = [
@@ -295,18 +536,37 @@ def plot_heatmaps(mode, call_df, put_df, call_pnl_df, put_pnl_df):
         fig.legend(handles=handles, loc='upper center', bbox_to_anchor=(0.5, 1.1), ncol=3,
                             fontsize=22, markerscale=4, frameon=True)
 
+    elif mode == 'Early Exercise Premium':
+        # Plot the American minus European value of Calls and Puts
+        draw_heatmap(call_df, ax=axs[0], cmap='magma', fmt=".2f")
+        axs[0].set_title('CALL Early Exercise Premium')
+        axs[0].set_xlabel('Spot Price')
+        axs[0].set_ylabel(ylabel)
+
+        draw_heatmap(put_df, ax=axs[1], cmap='magma', fmt=".2f")
+        axs[1].set_title('PUT Early Exercise Premium')
+        axs[1].set_xlabel('Spot Price')
+        axs[1].set_ylabel(ylabel)
+
+        handles = [
+            plt.Line2D([0], [0], color='black', label='No Premium'),
+            plt.Line2D([0], [0], color='red', label='Moderate Premium'),
+            plt.Line2D([0], [0], color='yellow', label='High Premium')
+        ]
+        fig.legend(handles=handles, loc='upper center', bbox_to_anchor=(0.5, 1.1), ncol=3,
+                   fontsize=22, markerscale=4, frameon=True)
 
     elif mode == 'P&L':
         # Plot Call and Put PnLs
-        sns.heatmap(call_pnl_df, ax=axs[0], cmap='RdYlGn', annot=True, cbar=True, fmt=".2f")
+        draw_heatmap(call_pnl_df, ax=axs[0], cmap='RdYlGn', fmt=".2f")
         axs[0].set_title('CALL P&Ls')
         axs[0].set_xlabel('Spot Price')
-        axs[0].set_ylabel('Volatility')
+        axs[0].set_ylabel(ylabel)
 
-        sns.heatmap(put_pnl_df, ax=axs[1], cmap='RdYlGn', annot=True, cbar=True, fmt=".2f")
+        draw_heatmap(put_pnl_df, ax=axs[1], cmap='RdYlGn', fmt=".2f")
         axs[1].set_title('PUT P&Ls')
         axs[1].set_xlabel('Spot Price')
-        axs[1].set_ylabel('Volatility')
+        axs[1].set_ylabel(ylabel)
 
         handles = [
             plt.Line2D([0], [0], color='darkred', label='Negative P&L'),
@@ -315,6 +575,8 @@ def plot_heatmaps(mode, call_df, put_df, call_pnl_df, put_pnl_df):
         ]
         fig.legend(handles=handles, loc='upper center', bbox_to_anchor=(0.5, 1.1), ncol=3,
                             fontsize=22, markerscale=4, frameon=True)
-    plt.tight_layout()
-    st.pyplot(fig)
+    with perf.stage('render'):
+        plt.tight_layout()
+        st.pyplot(fig)
+    plt.close(fig)
 
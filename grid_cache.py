@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import perf
+from pricing import bs_values
+
+
+# Memoized call/put price grids for Calculate_Option_Values
+# A grid depends only on its spot and volatility axes and on (strike, rate, maturity, dividend yield), so
+# purchase-price and mode changes are served entirely from the cache, and a grid whose axes share points
+# with a cached grid of the same inputs only prices the cells it does not share
+# A cache may be shared by several threads (main.py keeps one per process for every Streamlit session), so lookups
+# and insertions are serialized by a lock
+
+
+class GridCache:
+    # maxsize is the number of grids kept, the least recently used one is dropped first
+    # rtol is the relative tolerance under which two grid points are considered the same
+
+    def __init__(self, maxsize=32, rtol=1e-9):
+        self.maxsize = maxsize
+        self.rtol = rtol
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._grids)
+
+    def clear(self):
+        with self._lock:
+            self._grids.clear()
+
+    @perf.timed('grid_cache')
+    def price_grid(self, spot_interval, vol_interval, strike_price, risk_free_rate, time_to_maturity, dividend_yield):
+        # Returns read-only (call_values, put_values) vol x spot grids, as priced by Bs_Values
+        with self._lock:
+            return self._price_grid(spot_interval, vol_interval, strike_price, risk_free_rate, time_to_maturity,
+                                    dividend_yield)
+
+    def _price_grid(self, spot_interval, vol_interval, strike_price, risk_free_rate, time_to_maturity, dividend_yield):
+        spot_interval = np.asarray(spot_interval, dtype=np.float64)
+        vol_interval = np.asarray(vol_interval, dtype=np.float64)
+        params = (float(strike_price), float(risk_free_rate), float(time_to_maturity), float(dividend_yield))
+        key = (params, spot_interval.tobytes(), vol_interval.tobytes())
+
+        if key in self._grids:
+            self._grids.move_to_end(key)
+            self.hits += 1
+            _, _, call_values, put_values = self._grids[key]
+            return call_values, put_values
+
+        def price(spots, vols):
+            return bs_values(spots[np.newaxis, :], strike_price, risk_free_rate, time_to_maturity,
+                             vols[:, np.newaxis], dividend_yield)
+
+        source = self._best_overlap(params, spot_interval, vol_interval)
+        if source is None:
+            self.misses += 1
+            call_values, put_values = price(spot_interval, vol_interval)
+        else:
+            self.partial_hits += 1
+            (spots_from, spots_to), (vols_from, vols_to), cached_call, cached_put = source
+            call_values = np.empty((len(vol_interval), len(spot_interval)))
+            put_values = np.empty_like(call_values)
+
+            # Cells on shared spots and shared vols are copied
+            call_values[np.ix_(vols_to, spots_to)] = cached_call[np.ix_(vols_from, spots_from)]
+            put_values[np.ix_(vols_to, spots_to)] = cached_put[np.ix_(vols_from, spots_from)]
+
+            # Rows of new vols are priced over every spot, then the new spots of the shared vol rows
+            new_vols = np.setdiff1d(np.arange(len(vol_interval)), vols_to)
+            new_spots = np.setdiff1d(np.arange(len(spot_interval)), spots_to)
+            if new_vols.size:
+                call_values[new_vols], put_values[new_vols] = price(spot_interval, vol_interval[new_vols])
+            if new_spots.size:
+                call_block, put_block = price(spot_interval[new_spots], vol_interval[vols_to])
+                call_values[np.ix_(vols_to, new_spots)] = call_block
+                put_values[np.ix_(vols_to, new_spots)] = put_block
+
+        call_values.setflags(write=False)
+        put_values.setflags(write=False)
+        self._grids[key] = (spot_interval, vol_interval, call_values, put_values)
+        while len(self._grids) > self.maxsize:
+            self._grids.popitem(last=False)
+        return call_values, put_values
+
+    def _best_overlap(self, params, spot_interval, vol_interval):
+        # Cached grid of the same inputs sharing the most cells with the requested one, with the index pairs of
+        # the shared spots and vols, or None when no cached grid shares a cell
+        best, best_cells = None, 0
+        for (cached_params, _, _), (spots, vols, call_values, put_values) in reversed(self._grids.items()):
+            if cached_params != params:
+                continue
+            spot_pairs = self._shared_points(spots, spot_interval)
+            vol_pairs = self._shared_points(vols, vol_interval)
+            cells = len(spot_pairs[0]) * len(vol_pairs[0])
+            if cells > best_cells:
+                best, best_cells = (spot_pairs, vol_pairs, call_values, put_values), cells
+        return best
+
+    def _shared_points(self, cached, wanted):
+        # Index pairs (into cached, into wanted) of the points present on both axes
+        order = np.argsort(cached)
+        ordered = cached[order]
+        position = np.clip(np.searchsorted(ordered, wanted), 1, len(ordered) - 1) if len(ordered) > 1 \
+            else np.zeros(len(wanted), dtype=int)
+        lower = np.maximum(position - 1, 0)
+        nearest = np.where(np.abs(ordered[lower] - wanted) <= np.abs(ordered[position] - wanted), lower, position)
+        shared = np.abs(ordered[nearest] - wanted) <= self.rtol * np.maximum(np.abs(wanted), 1.0)
+        return order[nearest[shared]], np.flatnonzero(shared)
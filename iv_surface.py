@@ -0,0 +1,149 @@
+import hashlib
+
+import numpy as np
+
+import perf
+
+
+# Implied volatility surface of a whole option chain, indexed by log-moneyness log(K / F) and time to expiration
+# Each expiration's smile is smoothed into a convex quadratic in log-moneyness of the total variance iv^2 * T,
+# evaluated on a fixed log-moneyness grid and made non-decreasing in maturity (no calendar arbitrage)
+# The bilinear interpolation coefficients of every grid cell are computed once per build, so a lookup of any
+# number of (K, T) points is a vectorized search and one multiply-add per point
+# An update refits only the expirations whose quotes changed since the previous build
+
+
+class IVSurface:
+    # moneyness is the log-moneyness grid the smiles are evaluated on, queries outside it are clamped to its ends
+    # min_iv and max_iv bound the quoted implied volatilities that are used, the others are treated as bad quotes
+
+    def __init__(self, moneyness=np.linspace(-1.0, 1.0, 81), min_iv=0.01, max_iv=5.0):
+        self.moneyness = np.asarray(moneyness, dtype=np.float64)
+        self.min_iv = min_iv
+        self.max_iv = max_iv
+        self.spot = None
+        self.risk_free_rate = None
+        self.dividend_yield = None
+        # Expiration -> (time to expiration, digest of its quotes, total variance on the moneyness grid)
+        self._smiles = {}
+        self._times = None
+        self._coefficients = None
+        self.version = None
+        self.refits = 0
+
+    def __len__(self):
+        return len(self._smiles)
+
+    @perf.timed('iv_surface_update')
+    def update(self, calls, puts, spot, risk_free_rate, dividend_yield):
+        # (Re)builds the surface from calls_all and puts_all of Get_Option_Chains_Spot
+        # Only the expirations whose quotes changed are refitted; a new spot, rate or dividend yield moves every
+        # forward and refits them all
+        # Returns the number of refitted expirations
+        market = (float(spot), float(risk_free_rate), float(dividend_yield))
+        if market != (self.spot, self.risk_free_rate, self.dividend_yield):
+            self._smiles.clear()
+            self.spot, self.risk_free_rate, self.dividend_yield = market
+
+        # Out-of-the-money quotes only (puts below the forward, calls above it), their prices carry the smile
+        quotes = []
+        for options, is_call in ((calls, True), (puts, False)):
+            strike = options["strike"].to_numpy(dtype=np.float64)
+            T = options["time_to_expiration"].to_numpy(dtype=np.float64)
+            iv = options["impliedVolatility"].to_numpy(dtype=np.float64)
+            k = np.log(strike / self._forward(T))
+            keep = ((k >= 0) == is_call) & (iv >= self.min_iv) & (iv <= self.max_iv) & (T > 0)
+            quotes.append((options["expiration"].to_numpy()[keep], T[keep], k[keep], iv[keep]))
+        expirations, T, k, iv = (np.concatenate(column) for column in zip(*quotes))
+
+        keys, group = np.unique(expirations, return_inverse=True)
+        order = np.argsort(group, kind='stable')
+        bounds = np.searchsorted(group[order], np.arange(len(keys) + 1))
+
+        refitted = 0
+        smiles = {}
+        for i, key in enumerate(keys):
+            rows = order[bounds[i]:bounds[i + 1]]
+            digest = hashlib.blake2b(b''.join(x[rows].tobytes() for x in (T, k, iv)), digest_size=16).digest()
+            cached = self._smiles.get(key)
+            if cached is not None and cached[1] == digest:
+                smiles[key] = cached
+                continue
+            smiles[key] = (float(T[rows].mean()), digest, self._fit_smile(k[rows], iv[rows] ** 2 * T[rows]))
+            refitted += 1
+
+        self._smiles = smiles
+        self.refits += refitted
+        self._build()
+        return refitted
+
+    def _forward(self, T):
+        return self.spot * np.exp((self.risk_free_rate - self.dividend_yield) * T)
+
+    def _fit_smile(self, k, w):
+        # Total variance of one expiration on the moneyness grid: a least-squares quadratic in log-moneyness,
+        # linear when the best quadratic is concave, held flat beyond the quoted moneyness range
+        degree = min(2, len(k) - 1)
+        if degree == 2:
+            coefficients = np.polyfit(k, w, 2)
+            if coefficients[0] < 0:
+                degree = 1
+        if degree < 2:
+            coefficients = np.polyfit(k, w, degree) if degree > 0 else w[:1]
+        grid = np.clip(self.moneyness, k.min(), k.max())
+        return np.maximum(np.polyval(coefficients, grid), 1e-8)
+
+    def _build(self):
+        # Calendar-monotone total variance grid and its bilinear cell coefficients
+        if not self._smiles:
+            self._times = self._coefficients = self.version = None
+            return
+
+        smiles = sorted(self._smiles.values(), key=lambda smile: smile[0])
+        # A zero-variance row at T = 0 makes short maturities extrapolate at the volatility of the first expiration
+        times = np.concatenate(([0.0], [smile[0] for smile in smiles]))
+        variance = np.vstack([np.zeros(len(self.moneyness))] + [smile[2] for smile in smiles])
+        variance = np.maximum.accumulate(variance, axis=0)
+
+        w00, w01 = variance[:-1, :-1], variance[:-1, 1:]
+        w10, w11 = variance[1:, :-1], variance[1:, 1:]
+        # w(t, k) = c0 + c1 * ft + c2 * fk + c3 * ft * fk inside a cell, ft and fk being the fractional positions
+        self._coefficients = np.stack((w00, w10 - w00, w01 - w00, w11 - w10 - w01 + w00), axis=-1)
+        self._times = times
+        self.version = hashlib.blake2b(b''.join(smile[1] for smile in smiles) + repr(
+            (self.spot, self.risk_free_rate, self.dividend_yield)).encode(), digest_size=16).hexdigest()
+
+    @perf.timed('iv_surface_query')
+    def total_variance(self, log_moneyness, time_to_expiration, chunk_size=1 << 20):
+        # Interpolated total variance at arrays of (log-moneyness, time to expiration), broadcast against each other
+        # Beyond the last expiration the volatility of the last expiration is held constant
+        # Points are processed chunk_size at a time, which bounds the temporaries of very large queries
+        if self._coefficients is None:
+            raise ValueError("The implied volatility surface is empty, update it with an option chain first.")
+        k, T = np.broadcast_arrays(np.asarray(log_moneyness, dtype=np.float64),
+                                   np.asarray(time_to_expiration, dtype=np.float64))
+        shape = k.shape
+        k, T = k.ravel(), T.ravel()
+
+        times, moneyness = self._times, self.moneyness
+        variance = np.empty(k.size)
+        for start in range(0, k.size, chunk_size):
+            part = slice(start, start + chunk_size)
+            t = np.clip(T[part], 0.0, times[-1])
+            x = np.clip(k[part], moneyness[0], moneyness[-1])
+            i = np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 2)
+            j = np.clip(np.searchsorted(moneyness, x, side='right') - 1, 0, len(moneyness) - 2)
+            ft = (t - times[i]) / (times[i + 1] - times[i])
+            fk = (x - moneyness[j]) / (moneyness[j + 1] - moneyness[j])
+            c = self._coefficients[i, j]
+            w = c[:, 0] + c[:, 1] * ft + c[:, 2] * fk + c[:, 3] * ft * fk
+            variance[part] = np.where(T[part] > times[-1], w * T[part] / times[-1], w)
+        return variance.reshape(shape)
+
+    def implied_volatility(self, strike, time_to_expiration):
+        # Smoothed implied volatility at arrays of (strike, time to expiration), broadcast against each other
+        # NaN where the time to expiration is not positive
+        strike = np.asarray(strike, dtype=np.float64)
+        T = np.asarray(time_to_expiration, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(self.total_variance(np.log(strike / self._forward(T)), T) / np.where(T > 0, T, np.nan))
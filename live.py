@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+import perf
+from pricing import bs_values
+
+logger = logging.getLogger(__name__)
+
+
+# Live spot updates for the mispricing view
+# A quote source is any object with get_spot(ticker_symbol) -> latest spot price, so every source of
+# data_sources.py works (YFinanceSource polls Yahoo Finance); SimulatedQuotes is a local feed for testing
+# SpotPoller polls a source from an asyncio loop on a background thread and pushes (received_at, spot) ticks into a
+# queue, LiveMispricing keeps a rolling strike x tick window of theoretical minus market prices and prices only
+# the column of the newest tick, and LiveHeatmap redraws only the heatmap images of a figure drawn once
+
+# Least number of seconds between two logged poll failures of a SpotPoller, the failures in between are only counted
+ERROR_LOG_INTERVAL = 10.0
+
+
+class SimulatedQuotes:
+    # Local spot feed following a geometric Brownian motion, one step per call (no network)
+    # spot is the starting price, volatility the annual volatility and step the simulated time between two quotes
+    # in years (one second of trading by default)
+
+    def __init__(self, spot=100.0, volatility=0.2, step=1 / (252 * 6.5 * 3600), seed=0):
+        self.spot = float(spot)
+        self.volatility = volatility
+        self.step = step
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def get_spot(self, ticker_symbol):
+        with self._lock:
+            shock = self._rng.standard_normal()
+            self.spot *= np.exp(-0.5 * self.volatility ** 2 * self.step + self.volatility * np.sqrt(self.step) * shock)
+            return self.spot
+
+
+class SpotPoller:
+    # Polls source.get_spot every interval seconds on a background asyncio loop
+    # Ticks are (received_at, spot) pairs, received_at being a time.perf_counter() value; at most max_pending ticks
+    # are kept, the oldest are dropped when the consumer falls behind
+
+    def __init__(self, source, ticker_symbol, interval=1.0, max_pending=100):
+        self.source = source
+        self.ticker_symbol = ticker_symbol
+        self.interval = interval
+        self.ticks = queue.Queue(maxsize=max_pending)
+        self.errors = 0
+        self._loop = None
+        self._thread = None
+        self._polling = None
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=f"spot-poller-{self.ticker_symbol}",
+                                        daemon=True)
+        self._thread.start()
+        self._polling = asyncio.run_coroutine_threadsafe(self._start_polling(), self._loop).result()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._cancel(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def _start_polling(self):
+        return asyncio.create_task(self._poll())
+
+    async def _cancel(self):
+        # Cancels the polling task and waits for it to finish, on the poller loop
+        self._polling.cancel()
+        await asyncio.gather(self._polling, return_exceptions=True)
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        last_logged = float('-inf')
+        while True:
+            started = loop.time()
+            try:
+                # The source may block (network), so it runs on the default executor
+                spot = await loop.run_in_executor(None, self.source.get_spot, self.ticker_symbol)
+            except Exception as e:
+                self.errors += 1
+                # A dead feed fails on every poll, so failures are logged at most once per ERROR_LOG_INTERVAL
+                if started - last_logged >= ERROR_LOG_INTERVAL:
+                    logger.warning("Spot update for ticker %s failed with error: %s (%d failed polls so far)",
+                                   self.ticker_symbol, e, self.errors)
+                    last_logged = started
+            else:
+                self._push((time.perf_counter(), float(spot)))
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+    def _push(self, tick):
+        while True:
+            try:
+                self.ticks.put_nowait(tick)
+                return
+            except queue.Full:
+                try:
+                    self.ticks.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        # Next tick, or None when none arrives within timeout seconds
+        try:
+            return self.ticks.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LiveMispricing:
+    # Rolling strike x tick window of theoretical minus market prices for one option type
+    # options are the contracts to follow (strike, lastPrice, impliedVolatility and time_to_expiration columns) and
+    # put_or_call is 'C' or 'P'; window is the number of ticks kept
+    # surface is an optional IVSurface (see iv_surface.py) whose volatilities replace the quoted ones
+    # The contract columns are extracted once, so a tick only prices one column of len(options) values
+
+    def __init__(self, options, put_or_call, risk_free_rate, dividend_yield, window=60, surface=None):
+        options = options.sort_values("strike")
+        self.strikes = options["strike"].to_numpy(dtype=np.float64)
+        self._T = options["time_to_expiration"].to_numpy(dtype=np.float64)
+        self._v = options["impliedVolatility"].to_numpy(dtype=np.float64) if surface is None \
+            else surface.implied_volatility(self.strikes, self._T)
+        self._market = options["lastPrice"].to_numpy(dtype=np.float64)
+        self._is_call = put_or_call == 'C'
+        self.risk_free_rate = risk_free_rate
+        self.dividend_yield = dividend_yield
+        self.window = window
+        self._values = np.full((len(self.strikes), window), np.nan)
+        self.spots = np.full(window, np.nan)
+        self._next = 0
+        self.ticks = 0
+
+    @perf.timed('live_reprice')
+    def update(self, spot):
+        # Prices the contracts at the new spot into the oldest column of the window
+        with np.errstate(divide='ignore', invalid='ignore'):
+            call, put = bs_values(spot, self.strikes, self.risk_free_rate, self._T, self._v, self.dividend_yield)
+        self._values[:, self._next] = (call if self._is_call else put) - self._market
+        self.spots[self._next] = spot
+        self._next = (self._next + 1) % self.window
+        self.ticks += 1
+
+    def frame(self):
+        # Strike x tick values, oldest tick first (NaN columns until the window has filled)
+        return np.roll(self._values, -self._next, axis=1)
+
+
+class LiveHeatmap:
+    # Call and put LiveMispricing windows drawn side by side, refreshed in place on every tick
+    # The axes, labels and colorbars are rendered once; a frame restores that background and redraws only the two
+    # images (blitting), and the whole figure is redrawn only when the values outgrow the color scale
+    # dpi sets the resolution of the frames
+
+    def __init__(self, call_strikes, put_strikes, window, dpi=72):
+        # matplotlib is only imported when a live heatmap is drawn
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=(20, 8), dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        axs = self.figure.subplots(1, 2)
+
+        self.images = []
+        for ax, strikes, title in ((axs[0], call_strikes, 'Call Mis-pricing (Live)'),
+                                   (axs[1], put_strikes, 'Put Mispricing (Live)')):
+            image = ax.imshow(np.full((len(strikes), window), np.nan), cmap='RdBu', aspect='auto',
+                              interpolation='nearest', animated=True)
+            self.figure.colorbar(image, ax=ax)
+            rows = np.unique(np.linspace(0, len(strikes) - 1, min(len(strikes), 12)).astype(int))
+            ax.set_yticks(rows, [f"{strike:.2f}" for strike in np.asarray(strikes)[rows]])
+            ax.set_title(title)
+            ax.set_xlabel('Spot Tick (latest on the right)')
+            ax.set_ylabel('Strike Price')
+            self.images.append(image)
+        self.figure.tight_layout()
+
+        self.limit = 0.0
+        self._background = None
+
+    @perf.timed('live_render')
+    def render(self, call_values, put_values):
+        # Pushes new strike x tick windows into the images; returns the frame as an RGBA array
+        values = np.concatenate((np.ravel(call_values), np.ravel(put_values)))
+        values = values[np.isfinite(values)]
+        peak = float(np.abs(values).max()) if values.size else 0.0
+        canvas = self.figure.canvas
+
+        if self._background is None or peak > self.limit:
+            # The color scale keeps headroom so it is not widened on every tick
+            self.limit = max(1.5 * peak, 1e-6)
+            for image in self.images:
+                image.set_clim(-self.limit, self.limit)
+            canvas.draw()
+            self._background = canvas.copy_from_bbox(self.figure.bbox)
+
+        canvas.restore_region(self._background)
+        for image, frame in zip(self.images, (call_values, put_values)):
+            image.set_data(frame)
+            image.axes.draw_artist(image)
+        return np.asarray(canvas.buffer_rgba()).copy()
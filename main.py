@@ -1,16 +1,84 @@
 import streamlit as st
 import functions as f
-import pandas as pd
+import snapshot_cache as sc
+import perf
+from grid_cache import GridCache
+from iv_surface import IVSurface
+from expiry_index import ExpiryIndex
+import live
+from datetime import datetime
+from collections import deque
+import time
 import numpy as np
+import pandas as pd
 
 st.set_page_config(layout="wide")
 
+
+@st.cache_resource
+def price_grid_cache():
+    # Price grids shared by every rerun of every session (one per process, GridCache is thread-safe), so P&L and
+    # mode changes do not reprice the grid
+    return GridCache(maxsize=32)
+
+
+@st.cache_resource(max_entries=4)
+def time_decay_cube(*args, **kwargs):
+    # Maturity x vol x spot price cube, priced once per set of inputs; the maturity slider only reads slices of it
+    # Kept as a shared read-only resource, so a slider move does not copy the cube out of the cache
+    return f.calculate_time_decay_cube(*args, **kwargs)
+
+
+@st.cache_resource(max_entries=4)
+def expiry_index(calls_all, puts_all):
+    # Expirations of the chain sorted once, shared by every rerun on the same chain
+    return ExpiryIndex(calls_all, puts_all)
+
+
+def iv_surface(ticker_symbol):
+    # One implied volatility surface per ticker and session, kept across reruns so new chains only refit the changed
+    # expirations; surfaces live in st.session_state so sessions never refit or read each other's surface
+    surfaces = st.session_state.setdefault('iv_surfaces', {})
+    if ticker_symbol not in surfaces:
+        surfaces[ticker_symbol] = IVSurface()
+    return surfaces[ticker_symbol]
+
+
+@st.cache_resource(max_entries=4)
+def mispricing_cubes(calls_all, puts_all, min_spot, max_spot, risk_free_rate, dividend_yield, n_spot,
+                     surface_version=None, _surface=None):
+    # Full-chain mispricing cubes, recomputed only when the chain, the pricing inputs or the surface change
+    # (_surface is not hashed, surface_version identifies it)
+    # Kept as a shared read-only resource, so a rerun does not unpickle a copy of the cubes; mispricing_view only
+    # reads them, and they are flagged read-only to keep it that way
+    cubes = (f.calculate_mispricing_cube(min_spot, max_spot, calls_all, 'C', risk_free_rate, dividend_yield, n_spot,
+                                         surface=_surface),
+             f.calculate_mispricing_cube(min_spot, max_spot, puts_all, 'P', risk_free_rate, dividend_yield, n_spot,
+                                         surface=_surface))
+    for cube in cubes:
+        cube[-1].setflags(write=False)
+    return cubes
+
+
+@st.cache_data(max_entries=8)
+def early_exercise_premium(*args, **kwargs):
+    # Early exercise premium grids, the binomial lattices are only rolled back when an input changes
+    return f.calculate_early_exercise_premium(*args, **kwargs)
+
+
 # Major program mode selection
 program_mode = st.sidebar.radio(
     'Select Program Mode:',
     ('Black-Scholes Pricer', 'Historical Ticker Data Pricer')
 )
 
+# Optional per-stage timings of this run, recorded per session (instrumentation is off unless the panel is shown,
+# which it is by default when BS_PERF=1)
+perf.use(st.session_state.setdefault('perf_recorder', perf.Recorder()))
+show_performance = st.sidebar.checkbox('Show Performance Panel', value=perf.ENABLED_BY_DEFAULT)
+perf.set_enabled(show_performance)
+perf.reset()
+
 if program_mode == "Black-Scholes Pricer":
 
     # Header
@@ -29,7 +97,7 @@ if program_mode == "Black-Scholes Pricer":
     # Mode selection
     mode = st.sidebar.radio(
         'Select Mode:',
-        ('Pricing', 'P&L')
+        ('Pricing', 'P&L', 'Early Exercise Premium') + f.GREEKS + ('Time Decay', 'Portfolio P&L')
     )
 
     # Conditionally display "Purchase Price" input or explanation text
@@ -59,6 +127,8 @@ if program_mode == "Black-Scholes Pricer":
 
     spot_min = st.sidebar.number_input('Min Spot Price($)', value=0.5 * current_price, format="%.2f")
     spot_max = st.sidebar.number_input('Max Spot Price($)', value=1.5 * current_price, format="%.2f")
+    grid_resolution = st.sidebar.number_input('Heatmap Resolution (points per axis)', min_value=2, max_value=2000,
+                                              value=11, step=1)
 
     # Display Black Scholes Variables in a wide format using Streamlit columns
     colA, colB, colC, colD, colE, colF = st.columns([1, 1, 1, 1, 1, 1])
@@ -103,12 +173,103 @@ if program_mode == "Black-Scholes Pricer":
 
     st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
 
-    call_df, put_df, call_pnl_df, put_pnl_df = f.calculate_option_values(spot_min, spot_max, vol_min_selected,
-                                                                         vol_max_selected, strike_price, risk_free_rate,
-                                                                         time_to_maturity,
-                                                                         dividend_yield=dividend_yield,
-                                                                         purchase_price=purchase_price)
-    heatmap = f.plot_heatmaps(mode=mode, call_df=call_df, put_df=put_df, call_pnl_df=call_pnl_df, put_pnl_df=put_pnl_df)
+    if mode in f.GREEKS:
+        greek_dfs = f.calculate_greek_values(spot_min, spot_max, vol_min_selected, vol_max_selected, strike_price,
+                                             risk_free_rate, time_to_maturity, dividend_yield=dividend_yield,
+                                             n_spot=grid_resolution, n_vol=grid_resolution)
+        heatmap = f.greek_heatmaps(mode, *greek_dfs[mode])
+    elif mode == 'Time Decay':
+        # The cube runs from the input Time to Maturity down to one day
+        st.sidebar.markdown("---")
+        st.sidebar.subheader("Time Decay")
+        # The cube holds maturity steps x resolution^2 cells, capped at f.TIME_DECAY_MAX_CELLS
+        decay_resolution = min(grid_resolution, int((f.TIME_DECAY_MAX_CELLS // 2) ** 0.5))
+        if decay_resolution < grid_resolution:
+            st.sidebar.caption(f"Time decay grids are limited to {decay_resolution} points per axis.")
+        max_steps = min(365, f.TIME_DECAY_MAX_CELLS // decay_resolution ** 2)
+        maturity_steps = st.sidebar.number_input('Maturity Steps', min_value=2, max_value=max_steps,
+                                                 value=min(30, max_steps), step=1)
+        cube = time_decay_cube(spot_min, spot_max, vol_min_selected, vol_max_selected, strike_price, risk_free_rate,
+                               time_to_maturity, dividend_yield, n_spot=decay_resolution, n_vol=decay_resolution,
+                               n_time=maturity_steps)
+        time_interval = cube[0]
+
+        maturity_index = st.select_slider('Time to Maturity (Years)', options=range(len(time_interval)),
+                                          format_func=lambda i: f"{time_interval[i]:.3f}")
+        play = st.button('Play Time Decay')
+
+        heatmap_placeholder = st.empty()
+        for index in (range(len(time_interval)) if play else [maturity_index]):
+            slice_call_df, slice_put_df = f.time_decay_slice(cube, index)
+            with heatmap_placeholder.container():
+                st.markdown(f"**Time to Maturity:** {time_interval[index]:.3f} years")
+                heatmap = f.plot_heatmaps(mode='Pricing', call_df=slice_call_df, put_df=slice_put_df,
+                                          call_pnl_df=None, put_pnl_df=None)
+    elif mode == 'Early Exercise Premium':
+        # American options priced on a binomial lattice; more steps are more accurate and slower
+        st.sidebar.markdown("---")
+        st.sidebar.subheader("Early Exercise")
+        # The lattice cost grows with cells x steps^2, so the grid and the steps are capped for this mode
+        lattice_resolution = min(grid_resolution, f.EARLY_EXERCISE_MAX_RESOLUTION)
+        if lattice_resolution < grid_resolution:
+            st.sidebar.caption(f"Early exercise grids are limited to {lattice_resolution} points per axis.")
+        max_steps = min(2000, f.max_lattice_steps(lattice_resolution, lattice_resolution))
+        lattice_steps = st.sidebar.number_input('Lattice Steps', min_value=10, max_value=max_steps,
+                                                value=min(200, max_steps), step=10)
+        premium_call_df, premium_put_df = early_exercise_premium(spot_min, spot_max, vol_min_selected,
+                                                                 vol_max_selected, strike_price, risk_free_rate,
+                                                                 time_to_maturity, dividend_yield,
+                                                                 n_spot=lattice_resolution, n_vol=lattice_resolution,
+                                                                 steps=lattice_steps)
+        heatmap = f.plot_heatmaps(mode=mode, call_df=premium_call_df, put_df=premium_put_df, call_pnl_df=None,
+                                  put_pnl_df=None)
+    elif mode == 'Portfolio P&L':
+        # Book of option legs, each repriced at every spot and shift of its own volatility
+        st.sidebar.markdown("---")
+        st.sidebar.subheader("Portfolio Scenarios")
+        vol_shift_min, vol_shift_max = st.sidebar.slider('Volatility Shift Range', min_value=-0.5, max_value=0.5,
+                                                         value=(-0.1, 0.1))
+        days_forward = st.sidebar.number_input('Days Forward', min_value=0, max_value=3650, value=0, step=1)
+
+        st.markdown("**Option Legs** (quantity is negative for short legs, cost is the price per unit)")
+        legs = st.data_editor(pd.DataFrame({
+            'strike': [strike_price, 1.1 * strike_price, 0.9 * strike_price],
+            'time_to_expiration': [time_to_maturity] * 3,
+            'put_or_call': ['C', 'C', 'P'],
+            'quantity': [1.0, -1.0, 1.0],
+            'cost': [call_price, 0.0, put_price],
+            'vol': [volatility] * 3,
+        }), num_rows='dynamic', hide_index=True, column_config={
+            'put_or_call': st.column_config.SelectboxColumn('put_or_call', options=['C', 'P'], required=True),
+        }).dropna()
+
+        try:
+            total_df, call_legs_df, put_legs_df = f.calculate_portfolio_pnl(
+                legs, spot_min, spot_max, vol_shift_min, vol_shift_max, risk_free_rate, dividend_yield,
+                time_shift=days_forward / 365.0, n_spot=grid_resolution, n_vol=grid_resolution)
+            book_pnl = f.portfolio_pnl(legs, current_price, 0.0, days_forward / 365.0, risk_free_rate,
+                                       dividend_yield)['total'].item()
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
+
+        st.metric('Book P&L at the Spot Price', f"${book_pnl:,.2f}")
+        st.caption(f"Book P&L over the grid: ${total_df.to_numpy().min():,.2f} to ${total_df.to_numpy().max():,.2f}")
+        f.portfolio_heatmap(total_df)
+        heatmap = f.plot_heatmaps(mode='P&L', call_df=None, put_df=None, call_pnl_df=call_legs_df,
+                                  put_pnl_df=put_legs_df, ylabel='Volatility Shift')
+    else:
+        # Pricing and P&L modes, the only ones drawing the price grid
+        call_df, put_df, call_pnl_df, put_pnl_df = f.calculate_option_values(spot_min, spot_max, vol_min_selected,
+                                                                             vol_max_selected, strike_price,
+                                                                             risk_free_rate, time_to_maturity,
+                                                                             dividend_yield=dividend_yield,
+                                                                             purchase_price=purchase_price,
+                                                                             n_spot=grid_resolution,
+                                                                             n_vol=grid_resolution,
+                                                                             cache=price_grid_cache())
+        heatmap = f.plot_heatmaps(mode=mode, call_df=call_df, put_df=put_df, call_pnl_df=call_pnl_df,
+                                  put_pnl_df=put_pnl_df)
 
 elif program_mode == 'Historical Ticker Data Pricer':
 
@@ -123,50 +284,51 @@ elif program_mode == 'Historical Ticker Data Pricer':
     risk_free_rate = st.sidebar.number_input('Risk-Free Rate', min_value=0.0, max_value=1.0, value=0.03, format="%.4f")
     dividend_yield = st.sidebar.number_input('Dividend Yield', min_value=0.0, max_value=1.0, value=0.0, format="%.4f")
 
-    # Get the Calls and Puts
-    calls_all, puts_all, spot_price = f.get_option_chains_spot(ticker_symbol=ticker_symbol)
+    # Snapshot cache settings
+    cache_ttl = st.sidebar.number_input('Snapshot Cache TTL (minutes)', min_value=0, value=15, step=5)
+    replay = st.sidebar.checkbox('Offline Replay (use the latest stored snapshot)', value=False)
+
+    # Get the Calls and Puts (from the snapshot cache when fresh enough)
+    store = sc.SnapshotStore(ttl=cache_ttl * 60)
+    try:
+        calls_all, puts_all, spot_price, fetched_at = sc.load_option_chains_spot(ticker_symbol, store, replay=replay)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+    st.sidebar.caption(f"Option data as of {datetime.fromtimestamp(fetched_at):%Y-%m-%d %H:%M:%S}")
 
-    calls_all["expiration"] = pd.to_datetime(calls_all["expiration"])
-    puts_all["expiration"] = pd.to_datetime(puts_all["expiration"])
+    # Snapshots stored by older versions hold the expirations as 'YYYY-MM-DD' strings
+    for options in (calls_all, puts_all):
+        if not isinstance(options["expiration"].dtype, pd.CategoricalDtype):
+            options["expiration"] = pd.to_datetime(options["expiration"]).astype("category")
 
-    common_years = pd.Series(list(set(calls_all['expiration'].dt.year) & set(puts_all['expiration'].dt.year)))
+    # Maturity selectors answered by binary searches over the sorted expirations
+    expiries = expiry_index(calls_all, puts_all)
 
     # Date selection inputs
     st.sidebar.subheader('Option Maturity Date')
-    selected_year = st.sidebar.selectbox('Year', options=common_years)
-
-    filtered_calls_year = calls_all[calls_all['expiration'].dt.year == selected_year]
-    filtered_puts_year = puts_all[puts_all['expiration'].dt.year == selected_year]
-
-    common_months = pd.Series(list(set(filtered_calls_year['expiration'].dt.month) & set(filtered_puts_year['expiration'].dt.month)))
-    selected_month = st.sidebar.selectbox('Month', options=common_months)
-
-    filtered_calls_month = filtered_calls_year[filtered_calls_year['expiration'].dt.month == selected_month]
-    filtered_puts_month = filtered_puts_year[filtered_puts_year['expiration'].dt.month == selected_month]
-
-    common_days = pd.Series(list(set(filtered_calls_month['expiration'].dt.day) & set(filtered_puts_month['expiration'].dt.day)))
-    selected_day = st.sidebar.selectbox('Day', options=common_days)
+    selected_year = st.sidebar.selectbox('Year', options=expiries.years())
+    selected_month = st.sidebar.selectbox('Month', options=expiries.months(selected_year))
+    selected_day = st.sidebar.selectbox('Day', options=expiries.days(selected_year, selected_month))
 
     # Format the date to use in teh dataframes
     formatted_date = f"{selected_year}-{int(selected_month):02}-{int(selected_day):02}"
-    date_for_call = calls_all[calls_all['expiration'] == formatted_date]
-    date_for_put = puts_all[puts_all['expiration'] == formatted_date]
+    date_for_call, date_for_put = expiries.chains(formatted_date)
 
     # Time to maturity in float
     time_to_maturity = date_for_call["time_to_expiration"].iloc[0]
 
-    # Create the datapoints
-    call_n = len(date_for_call)
-    put_n = len(date_for_put)
-
-    call_indices = np.linspace(0, call_n - 1, 11, dtype=int)
-    put_indices = np.linspace(0, put_n - 1, 11, dtype=int)
-
-    call_datapoints = date_for_call.iloc[call_indices]
-    put_datapoints = date_for_put.iloc[put_indices]
+    # Mispricing view: a slice of the full-chain cube at the selected date, or its average over all dates
+    mispricing_view = st.sidebar.radio(
+        'Mispricing View:',
+        ('Selected Maturity', 'Average Over All Maturities')
+    )
 
-    call_datapoints = call_datapoints.reset_index(drop=True)
-    put_datapoints = put_datapoints.reset_index(drop=True)
+    # Volatility each contract is priced at: its own quote, or the smoothed surface of the whole chain
+    volatility_source = st.sidebar.radio(
+        'Volatility Source:',
+        ('Quoted IV per Contract', 'Smoothed IV Surface')
+    )
 
     # Spot price slider based on ticker data
     min_spot, max_spot = spot_price_slider = st.sidebar.slider(
@@ -176,6 +338,15 @@ elif program_mode == 'Historical Ticker Data Pricer':
         value=(0.5 * spot_price, 1.5 * spot_price),
         format="%.2f"
     )
+    spot_points = st.sidebar.number_input('Spot Grid Points', min_value=2, max_value=2000, value=11, step=1)
+
+    # Live mode: the selected maturity is repriced at every polled spot, newest tick on the right of the heatmap
+    live_mode = st.sidebar.checkbox('Live Spot Updates', value=False)
+    if live_mode:
+        quote_source = st.sidebar.radio('Quote Source:', ('Yahoo Finance', 'Simulated Feed'))
+        poll_interval = st.sidebar.number_input('Poll Interval (seconds)', min_value=0.1, value=1.0, step=0.5)
+        live_duration = st.sidebar.number_input('Live Duration (seconds)', min_value=1, value=60, step=10)
+        live_window = st.sidebar.number_input('Ticks Shown', min_value=2, max_value=1000, value=60, step=10)
 
     # Display Variables in a wide format using Streamlit columns
     colA, colB, colC, colD, colE, colF = st.columns([1, 1, 1, 1, 1, 1])
@@ -193,7 +364,74 @@ elif program_mode == 'Historical Ticker Data Pricer':
     with colF:
         st.markdown(f"**Spot Price Range:** ${spot_price_slider[0]:.2f} - ${spot_price_slider[1]:.2f}")
 
-    # Theoretical minus Market prices data
-    call_df, put_df = f.calculate_market_prices(min_spot, max_spot, call_datapoints, put_datapoints, risk_free_rate,
-                                                                                dividend_yield)
-    heatmap = f.market_heatmaps(call_df, put_df)
+    surface, surface_version = None, None
+    if volatility_source == 'Smoothed IV Surface':
+        surface = iv_surface(ticker_symbol)
+        try:
+            surface.update(calls_all, puts_all, spot_price, risk_free_rate, dividend_yield)
+            # Raises ValueError when every quote was filtered out and the surface is empty
+            surface.total_variance(0.0, time_to_maturity)
+        except ValueError as e:
+            st.warning(f"No usable quotes to fit a surface for ticker {ticker_symbol}, pricing at the quoted "
+                       f"implied volatilities instead ({e})")
+            surface = None
+        else:
+            surface_version = surface.version
+
+    if live_mode:
+        # Each tick reprices one column per option type and refreshes the images of a figure drawn once
+        if quote_source == 'Simulated Feed':
+            quotes = live.SimulatedQuotes(spot_price)
+        else:
+            from data_sources import YFinanceSource
+            quotes = YFinanceSource()
+        call_live = live.LiveMispricing(date_for_call, 'C', risk_free_rate, dividend_yield, live_window, surface)
+        put_live = live.LiveMispricing(date_for_put, 'P', risk_free_rate, dividend_yield, live_window, surface)
+        heatmap = live.LiveHeatmap(call_live.strikes, put_live.strikes, live_window)
+
+        status = st.empty()
+        plot = st.empty()
+        latencies = deque(maxlen=1000)
+        deadline = time.perf_counter() + live_duration
+        with live.SpotPoller(quotes, ticker_symbol, interval=poll_interval) as poller:
+            while time.perf_counter() < deadline:
+                tick = poller.get(timeout=min(1.0, max(0.0, deadline - time.perf_counter())))
+                if tick is None:
+                    continue
+                # Ticks that queued up during the previous render are priced, then drawn once; the latency is
+                # measured from the arrival of the newest one
+                ticks = [tick]
+                while (tick := poller.get(timeout=0)) is not None:
+                    ticks.append(tick)
+                for _, spot in ticks:
+                    call_live.update(spot)
+                    put_live.update(spot)
+
+                frame = heatmap.render(call_live.frame(), put_live.frame())
+                with perf.stage('render'):
+                    plot.image(frame)
+                latency = time.perf_counter() - ticks[-1][0]
+                if perf.is_enabled():
+                    perf.record('tick_to_render', latency)
+                latencies.append(latency * 1000)
+                status.markdown(f"**Live Spot:** ${ticks[-1][1]:.2f} | **Tick-to-Render:** {latencies[-1]:.1f} ms "
+                                f"(p50 {np.percentile(latencies, 50):.1f} ms, "
+                                f"p95 {np.percentile(latencies, 95):.1f} ms) | **Ticks:** {call_live.ticks}")
+        st.caption("Live updates stopped, rerun the app to resume them.")
+    else:
+        # Theoretical minus Market prices of every strike and expiration (cached), then the selected view of them
+        with perf.stage('mispricing_cubes'):
+            call_cube, put_cube = mispricing_cubes(calls_all, puts_all, min_spot, max_spot, risk_free_rate,
+                                                   dividend_yield, spot_points, surface_version=surface_version,
+                                                   _surface=surface)
+        view_date = pd.Timestamp(formatted_date) if mispricing_view == 'Selected Maturity' else None
+        call_df = f.mispricing_view(*call_cube, expiration=view_date)
+        put_df = f.mispricing_view(*put_cube, expiration=view_date)
+        heatmap = f.market_heatmaps(call_df, put_df, ylabel='Strike Price')
+
+# Performance panel: per-stage timings of this run, also exported as structured log lines
+if show_performance:
+    perf.log_stats()
+    with st.sidebar.expander('Performance', expanded=True):
+        st.dataframe(pd.DataFrame(perf.snapshot()).round(2), hide_index=True)
+        st.download_button('Export Timings (JSON Lines)', perf.to_json_lines(), file_name='perf_stages.jsonl')
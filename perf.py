@@ -0,0 +1,178 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+
+# Lightweight hot-path instrumentation: wall-clock timers and call counters per named stage
+# Disabled by default; enable it with set_enabled(True) or the BS_PERF=1 environment variable
+# While disabled, timed functions cost one flag check per call and stage() returns a shared no-op context
+#
+# Stages are recorded into the Recorder bound to the current thread with use() (the process-wide default one
+# otherwise), so each Streamlit session keeps its own timings; propagate() carries the binding to worker threads
+# log_stats() writes the stages as JSON lines to the file named by BS_PERF_LOG, or to stderr
+
+logger = logging.getLogger("perf")
+
+ENABLED_BY_DEFAULT = os.environ.get("BS_PERF") == "1"
+
+
+class Recorder:
+    # Enabled flag and recorded stages (name -> [calls, total seconds, longest call]) of one consumer
+
+    def __init__(self, enabled=ENABLED_BY_DEFAULT):
+        self.enabled = enabled
+        self.stats = {}
+        self.lock = threading.Lock()
+
+
+_default = Recorder()
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def _current():
+    return getattr(_local, "recorder", _default)
+
+
+def use(recorder):
+    # Binds recorder to the current thread (None restores the process-wide default)
+    _local.recorder = recorder if recorder is not None else _default
+
+
+def propagate(fn):
+    # Wraps fn so that it records into the current thread's recorder on whichever thread it runs
+    recorder = _current()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = _current()
+        _local.recorder = recorder
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.recorder = previous
+
+    return wrapper
+
+
+def set_enabled(enabled):
+    _current().enabled = bool(enabled)
+
+
+def is_enabled():
+    return _current().enabled
+
+
+def reset():
+    # Clears every recorded stage
+    recorder = _current()
+    with recorder.lock:
+        recorder.stats.clear()
+
+
+def record(name, seconds, recorder=None):
+    # Adds one call of seconds to the stage name
+    recorder = recorder or _current()
+    with recorder.lock:
+        stat = recorder.stats.get(name)
+        if stat is None:
+            recorder.stats[name] = [1, seconds, seconds]
+        else:
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    # Context manager timing the enclosed block as one call of the stage name
+    return _Stage(name) if _current().enabled else _NULL_STAGE
+
+
+def timed(name=None):
+    # Decorator timing every call of the decorated function, as the stage name (the function name by default)
+    def decorator(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _current()
+            if not recorder.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(stage_name, time.perf_counter() - start, recorder)
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot():
+    # Recorded stages as a list of dicts, the most expensive first
+    recorder = _current()
+    with recorder.lock:
+        rows = [
+            {"stage": name, "calls": calls, "total_ms": total * 1000, "mean_ms": total * 1000 / calls,
+             "max_ms": longest * 1000}
+            for name, (calls, total, longest) in recorder.stats.items()
+        ]
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def to_json_lines():
+    # Recorded stages as structured log lines, one JSON object per stage
+    timestamp = time.time()
+    return "\n".join(json.dumps({"event": "perf_stage", "timestamp": timestamp, **row}) for row in snapshot())
+
+
+def _log_handler():
+    # Unless the application configured the "perf" logger, its lines go to BS_PERF_LOG (appended) or stderr
+    with _log_lock:
+        if logger.handlers:
+            return
+        path = os.environ.get("BS_PERF_LOG")
+        handler = logging.FileHandler(path) if path else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def log_stats():
+    # Emits every recorded stage on the "perf" logger as a structured JSON line
+    _log_handler()
+    for line in to_json_lines().splitlines():
+        logger.info(line)
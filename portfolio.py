@@ -0,0 +1,100 @@
+import numpy as np
+
+import perf
+from pricing import bs_values
+
+
+# Scenario P&L of a book of option legs over a spot x volatility shift x time shift grid
+# Legs are columnar: one array (or DataFrame column) per field, one entry per leg
+#   strike, time_to_expiration (years), put_or_call ('C' or 'P'), quantity (negative when short),
+#   cost (price paid or received per unit) and vol (the leg's current volatility)
+# A scenario reprices every leg at spot S, its own volatility plus a shift, and its time to expiration minus the
+# elapsed time; legs expiring within a scenario are worth their intrinsic value
+#
+# Legs and scenarios are evaluated in blocks whose temporaries fit in a memory budget, and the blocks are reduced
+# to the book, call-leg and put-leg totals with matrix products, so peak memory does not grow with the book
+
+LEG_FIELDS = ('strike', 'time_to_expiration', 'put_or_call', 'quantity', 'cost', 'vol')
+
+# Approximate bytes of temporaries per (leg, scenario) pair of a block (a dozen float64 arrays in pricing)
+_BYTES_PER_CELL = 12 * 8
+
+
+def _legs(legs):
+    # Leg columns as flat arrays, validated against each other
+    missing = [field for field in LEG_FIELDS if field not in legs]
+    if missing:
+        raise ValueError(f"Missing leg fields: {', '.join(missing)}.")
+    columns = {field: np.ravel(np.asarray(legs[field], dtype=str if field == 'put_or_call' else np.float64))
+               for field in LEG_FIELDS}
+    if len({len(column) for column in columns.values()}) > 1:
+        raise ValueError("Every leg field must have one entry per leg.")
+    if not np.isin(columns['put_or_call'], ('C', 'P')).all():
+        raise ValueError("put_or_call must be 'C' or 'P' for every leg.")
+    return columns
+
+
+@perf.timed()
+def portfolio_pnl(legs, spot_interval, vol_shifts, time_shifts, risk_free_rate, dividend_yield, per_leg=False,
+                  memory_budget_mb=256):
+    # P&L of the book of legs over every (time shift, vol shift, spot) scenario
+    # spot_interval are the spots, vol_shifts are added to the volatility of every leg, time_shifts are the
+    # elapsed times in years
+    # memory_budget_mb bounds the temporaries of each evaluated block (the returned arrays come on top)
+    # Returns a dict of n_time x n_vol x n_spot arrays: 'total' for the whole book and 'call' / 'put' for the call
+    # and put legs, plus 'per_leg' (n_legs x n_time x n_vol x n_spot) when per_leg is set, None otherwise
+    legs = _legs(legs)
+    spot_interval, vol_shifts, time_shifts = (np.atleast_1d(np.asarray(x, dtype=np.float64))
+                                              for x in (spot_interval, vol_shifts, time_shifts))
+    shape = (len(time_shifts), len(vol_shifts), len(spot_interval))
+
+    # Scenarios flattened in (time, vol, spot) order
+    elapsed, shift, S = (np.broadcast_to(x, shape).ravel() for x in np.ix_(time_shifts, vol_shifts, spot_interval))
+
+    is_call = legs['put_or_call'] == 'C'
+    quantity = legs['quantity']
+    call_quantity = np.where(is_call, quantity, 0.0)
+    put_quantity = quantity - call_quantity
+    call_cost = call_quantity @ legs['cost']
+    put_cost = put_quantity @ legs['cost']
+
+    n_legs, n_scenarios = len(quantity), S.size
+    call_total = np.zeros(n_scenarios)
+    put_total = np.zeros(n_scenarios)
+    leg_pnl = np.empty((n_legs, n_scenarios)) if per_leg else None
+
+    budget_cells = max(1, int(memory_budget_mb * 1024 ** 2) // _BYTES_PER_CELL)
+    scenario_chunk = min(n_scenarios, budget_cells)
+    leg_chunk = max(1, budget_cells // scenario_chunk)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for leg_start in range(0, n_legs, leg_chunk):
+            rows = slice(leg_start, leg_start + leg_chunk)
+            X = legs['strike'][rows, np.newaxis]
+            call_rows = is_call[rows, np.newaxis]
+            for start in range(0, n_scenarios, scenario_chunk):
+                cols = slice(start, start + scenario_chunk)
+                T = legs['time_to_expiration'][rows, np.newaxis] - elapsed[np.newaxis, cols]
+                v = np.maximum(legs['vol'][rows, np.newaxis] + shift[np.newaxis, cols], 1e-4)
+                spots = S[np.newaxis, cols]
+
+                call, put = bs_values(spots, X, risk_free_rate, T, v, dividend_yield)
+                value = np.where(call_rows, call, put)
+                expired = T <= 0
+                if expired.any():
+                    intrinsic = np.where(call_rows, np.maximum(spots - X, 0.0), np.maximum(X - spots, 0.0))
+                    value = np.where(expired, intrinsic, value)
+
+                call_total[cols] += call_quantity[rows] @ value
+                put_total[cols] += put_quantity[rows] @ value
+                if per_leg:
+                    leg_pnl[rows, cols] = quantity[rows, np.newaxis] * (value - legs['cost'][rows, np.newaxis])
+
+    call_total -= call_cost
+    put_total -= put_cost
+    return {
+        'total': (call_total + put_total).reshape(shape),
+        'call': call_total.reshape(shape),
+        'put': put_total.reshape(shape),
+        'per_leg': leg_pnl.reshape((n_legs,) + shape) if per_leg else None,
+    }
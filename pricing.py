@@ -0,0 +1,368 @@
+import os
+
+import numpy as np
+from scipy.special import ndtr
+
+import perf
+
+
+# Core Black-Scholes pricing: values, implied volatilities and Greeks over NumPy arrays
+# Depends only on NumPy and scipy.special, so batch workers and short-lived jobs can import it without the
+# data-fetch and plotting stack (functions.py re-exports everything defined here)
+
+# Kernel backend of Bs_Values, Call_BS_Value and Put_BS_Value:
+# 'numpy', 'numba' (fused multi-threaded loop of pricing_numba.py, needs numba installed) or
+# 'auto' (numba when it is installed, NumPy otherwise); the initial value comes from BS_PRICING_BACKEND
+# NumPy is the default: its ndtr kernels matched or beat the numba ones in benchmarks.py (up to 200k options and
+# on few cores), so numba is only used when it is asked for
+BACKENDS = ('auto', 'numpy', 'numba')
+_backend = os.environ.get("BS_PRICING_BACKEND", "numpy")
+_numba = None
+
+
+def _numba_kernels():
+    # pricing_numba module, imported on first use, or None when numba is not installed
+    global _numba
+    if _numba is None:
+        try:
+            import pricing_numba
+            _numba = pricing_numba
+        except ImportError:
+            _numba = False
+    return _numba or None
+
+
+def set_backend(backend):
+    # Selects the kernel backend (one of BACKENDS)
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown pricing backend {backend!r}, use one of {', '.join(BACKENDS)}.")
+    if backend == 'numba' and _numba_kernels() is None:
+        raise ImportError("The numba pricing backend requires numba to be installed.")
+    _backend = backend
+
+
+def get_backend():
+    # Backend actually in use, 'numpy' or 'numba'
+    if _backend != 'numpy' and _numba_kernels() is not None:
+        return 'numba'
+    return 'numpy'
+
+
+def _norm_pdf(x):
+    # Standard normal density
+    return np.exp(-0.5 * x ** 2) * 0.3989422804014327
+
+
+@perf.timed()
+def call_bs_value(S, X, r, T, v, q):
+    # Calculates the value of a call option (Black-Scholes formula for call options with dividends)
+    # S is the share price at time T
+    # X is the strike price
+    # r is the risk-free interest rate
+    # T is the time to maturity in years (days/365)
+    # v is the volatility
+    # q is the dividend yield
+    if get_backend() == 'numba':
+        return _numba.bs_values(S, X, r, T, v, q)[0]
+    d_1 = (np.log(S / X) + (r - q + v ** 2 * 0.5) * T) / (v * np.sqrt(T))
+    d_2 = d_1 - v * np.sqrt(T)
+    return S * np.exp(-q * T) * ndtr(d_1) - X * np.exp(-r * T) * ndtr(d_2)
+
+
+def call_iv_obj_function(S, X, r, T, v, q, call_price):
+    # Objective function which sets market and model prices equal to zero (Function needed for Call_IV)
+    # The parameters are explained in the Call_BS_Value function
+    return call_price - call_bs_value(S, X, r, T, v, q)
+
+
+def call_iv(S, X, r, T, call_price, q, a=-2, b=2, xtol=0.000001):
+    # Calculates the implied volatility for a call option (scalar front end of Implied_Volatility)
+    # The first four parameters are explained in the Call_BS_Value function
+    # Call_Price is the price of the call option
+    # q is the dividend yield
+    # Last three variables bound the volatility search and set its tolerance
+    iv, _ = implied_volatility(S, X, r, T, call_price, 'C', q, a=a, b=b, xtol=xtol)
+    return float(iv)
+
+
+@perf.timed()
+def put_bs_value(S, X, r, T, v, q):
+    # Calculates the value of a put option (Black-Scholes formula for put options with dividends)
+    # The parameters are explained in the Call_BS_Value function
+    if get_backend() == 'numba':
+        return _numba.bs_values(S, X, r, T, v, q)[1]
+    d_1 = (np.log(S / X) + (r - q + v ** 2 * 0.5) * T) / (v * np.sqrt(T))
+    d_2 = d_1 - v * np.sqrt(T)
+    return X * np.exp(-r * T) * ndtr(-d_2) - S * np.exp(-q * T) * ndtr(-d_1)
+
+
+def put_iv_obj_function(S, X, r, T, v, q, put_price):
+    # Objective function which sets market and model prices equal to zero (Function needed for Put_IV)
+    # The parameters are explained in the Call_BS_Value function
+    return put_price - put_bs_value(S, X, r, T, v, q)
+
+
+def put_iv(S, X, r, T, put_price, q, a=-2, b=2, xtol=0.000001):
+    # Calculates the implied volatility for a put option (scalar front end of Implied_Volatility)
+    # The first four parameters are explained in the Call_BS_Value function
+    # Put_Price is the price of the put option
+    # q is the dividend yield
+    # Last three variables bound the volatility search and set its tolerance
+    iv, _ = implied_volatility(S, X, r, T, put_price, 'P', q, a=a, b=b, xtol=xtol)
+    return float(iv)
+
+
+def calculate_iv_call_put(S, X, r, T, option_price, put_or_call, q):
+    # This is a general function witch summarizes Call_IV and Put_IV (delivers the same results)
+    # Can be used for a Lambda function within Pandas
+    # The first four parameters are explained in the Call_BS_Value function
+    # Put_or_Call:
+    # 'C' returns the implied volatility of a call
+    # 'P' returns the implied volatility of a put
+    # Option_Price is the price of the option.
+    # q is the dividend yield
+
+    if put_or_call == 'C':
+        return call_iv(S, X, r, T, option_price, q)
+    if put_or_call == 'P':
+        return put_iv(S, X, r, T, option_price, q)
+    else:
+        return 'Neither call or put'
+
+
+# Convergence status codes returned by Implied_Volatility
+IV_NEWTON = 0      # converged with Newton steps
+IV_BRACKETED = 1   # converged with the bracketed fallback
+IV_FAILED = 2      # no volatility inside the search bracket reproduces the price
+
+
+def _price_and_vega(S, X, r, T, v, q, is_call):
+    # Option value (call or put per entry) and vega, sharing d_1/d_2 (helper for Implied_Volatility)
+    sqrt_t = np.sqrt(T)
+    d_1 = (np.log(S / X) + (r - q + v ** 2 * 0.5) * T) / (v * sqrt_t)
+    d_2 = d_1 - v * sqrt_t
+    spot_disc = S * np.exp(-q * T)
+    strike_disc = X * np.exp(-r * T)
+    call = spot_disc * ndtr(d_1) - strike_disc * ndtr(d_2)
+    put = strike_disc * ndtr(-d_2) - spot_disc * ndtr(-d_1)
+    vega = spot_disc * _norm_pdf(d_1) * sqrt_t
+    return np.where(is_call, call, put), vega
+
+
+@perf.timed()
+def implied_volatility(S, X, r, T, option_price, put_or_call, q, a=-2, b=2, xtol=0.000001, max_iter=20):
+    # Calculates the implied volatility of a whole option chain at once
+    # The first four parameters are explained in the Call_BS_Value function; all inputs broadcast against each other
+    # Option_Price is the price of each option and Put_or_Call is 'C' or 'P' per option
+    # q is the dividend yield
+    # a, b and xtol bound the volatility search and set its tolerance (as in Call_IV / Put_IV)
+    # Every option first takes vectorized Newton steps using vega, starting from the inflection point of the price
+    # curve; the options that fail to converge fall back to a vectorized bisection on the bracket [a, b]
+    # Returns the implied volatilities (NaN where none is found) and a per-option status (IV_NEWTON, IV_BRACKETED
+    # or IV_FAILED)
+    S, X, r, T, price, q, is_call = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (S, X, r, T, option_price, q)), np.asarray(put_or_call) == 'C')
+    shape = S.shape
+    S, X, r, T, price, q, is_call = (x.ravel() for x in (S, X, r, T, price, q, is_call))
+
+    # Volatilities at or below xtol are reported as NaN, so negative vols are never searched
+    lower = max(a, xtol)
+    upper = b
+
+    iv = np.full(S.size, np.nan)
+    status = np.full(S.size, IV_FAILED, dtype=np.int8)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Newton iterations on the options that are still unresolved
+        v = np.sqrt(2 * np.abs(np.log(S / X) + (r - q) * T) / T)
+        v = np.clip(np.maximum(v, 0.05), lower, upper)
+        active = np.arange(S.size)
+        for _ in range(max_iter):
+            if active.size == 0:
+                break
+            model, vega = _price_and_vega(S[active], X[active], r[active], T[active], v[active], q[active],
+                                          is_call[active])
+            step = (model - price[active]) / vega
+            new_v = v[active] - step
+
+            ok = np.isfinite(new_v) & (vega > 0) & (new_v >= lower) & (new_v <= upper)
+            done = ok & (np.abs(step) < xtol)
+            iv[active[done]] = new_v[done]
+            status[active[done]] = IV_NEWTON
+
+            v[active] = np.where(ok, new_v, v[active])
+            active = active[ok & ~done]
+
+        # Bracketed fallback for everything Newton did not resolve
+        pending = np.flatnonzero(status == IV_FAILED)
+        if pending.size:
+            args = (S[pending], X[pending], r[pending], T[pending])
+            target = price[pending]
+            call_put = is_call[pending]
+            lo = np.full(pending.size, lower)
+            hi = np.full(pending.size, upper)
+            f_lo = _price_and_vega(*args, lo, q[pending], call_put)[0] - target
+            f_hi = _price_and_vega(*args, hi, q[pending], call_put)[0] - target
+            bracketed = np.isfinite(f_lo) & np.isfinite(f_hi) & (f_lo * f_hi <= 0)
+
+            for _ in range(int(np.ceil(np.log2(max(upper - lower, xtol) / xtol)))):
+                mid = 0.5 * (lo + hi)
+                f_mid = _price_and_vega(*args, mid, q[pending], call_put)[0] - target
+                left = np.sign(f_mid) == np.sign(f_lo)
+                lo = np.where(left, mid, lo)
+                f_lo = np.where(left, f_mid, f_lo)
+                hi = np.where(left, hi, mid)
+
+            iv[pending[bracketed]] = 0.5 * (lo + hi)[bracketed]
+            status[pending[bracketed]] = IV_BRACKETED
+
+    failed = ~(iv > xtol)
+    iv[failed] = np.nan
+    status[failed] = IV_FAILED
+    return iv.reshape(shape), status.reshape(shape)
+
+
+@perf.timed()
+def bs_values(S, X, r, T, v, q):
+    # Calculates call and put values together over arrays of inputs (vectorized Black-Scholes with dividends)
+    # The parameters are explained in the Call_BS_Value function and broadcast against each other
+    # d_1/d_2 and the discount factors are computed once and shared between the call and the put
+    # With the numba backend the whole computation runs as one fused loop instead
+    if get_backend() == 'numba':
+        return _numba.bs_values(S, X, r, T, v, q)
+    vol_sqrt_t = v * np.sqrt(T)
+    d_1 = (np.log(S / X) + (r - q + v ** 2 * 0.5) * T) / vol_sqrt_t
+    d_2 = d_1 - vol_sqrt_t
+    spot_disc = S * np.exp(-q * T)
+    strike_disc = X * np.exp(-r * T)
+    call = spot_disc * ndtr(d_1) - strike_disc * ndtr(d_2)
+    put = strike_disc * ndtr(-d_2) - spot_disc * ndtr(-d_1)
+    return call, put
+
+
+def grid_axis(start, stop, n):
+    # n evenly spaced grid points, rounded to 2 decimals when that keeps them all distinct (so coarse grids are
+    # priced at their labels) and exact otherwise (so fine grids keep one distinct point per row or column)
+    axis = np.linspace(start, stop, n)
+    rounded = np.round(axis, 2)
+    return rounded if len(np.unique(rounded)) == len(np.unique(axis)) else axis
+
+
+def grid_labels(axis, decimals=2):
+    # Heatmap labels of a grid axis: rounded to 2 decimals, or to as many more as it takes to tell the points apart
+    axis = np.asarray(axis, dtype=np.float64)
+    distinct = len(np.unique(axis))
+    for places in range(decimals, 16):
+        labels = np.round(axis, places)
+        if len(np.unique(labels)) == distinct:
+            return labels
+    return axis
+
+
+def option_grid(min_spot, max_spot, min_vol, max_vol, n_spot=11, n_vol=11):
+    # Builds the spot and volatility axes of a heatmap grid (see grid_axis)
+    # n_spot and n_vol are the number of grid points along each axis
+    return grid_axis(min_spot, max_spot, n_spot), grid_axis(min_vol, max_vol, n_vol)
+
+
+GREEKS = ('Delta', 'Gamma', 'Vega', 'Theta', 'Rho')
+
+
+@perf.timed()
+def bs_greeks(S, X, r, T, v, q):
+    # Calculates all the Black-Scholes Greeks of calls and puts in one pass over arrays of inputs
+    # The parameters are explained in the Call_BS_Value function and broadcast against each other
+    # d_1/d_2, the normal pdf/cdf values and the discount factors are computed once and shared by every Greek
+    # Returns a dict mapping each name in GREEKS to a (call, put) pair
+    # Vega and Rho are per unit change of volatility and rate, Theta is per year
+    sqrt_t = np.sqrt(T)
+    vol_sqrt_t = v * sqrt_t
+    d_1 = (np.log(S / X) + (r - q + v ** 2 * 0.5) * T) / vol_sqrt_t
+    d_2 = d_1 - vol_sqrt_t
+
+    div_disc = np.exp(-q * T)
+    strike_disc = X * np.exp(-r * T)
+    pdf_d1 = _norm_pdf(d_1)
+    cdf_d1 = ndtr(d_1)
+    cdf_d2 = ndtr(d_2)
+
+    spot_div_disc = S * div_disc
+    gamma = div_disc * pdf_d1 / (S * vol_sqrt_t)
+    vega = spot_div_disc * pdf_d1 * sqrt_t
+    time_decay = -spot_div_disc * pdf_d1 * v / (2 * sqrt_t)
+
+    return {
+        'Delta': (div_disc * cdf_d1, div_disc * (cdf_d1 - 1)),
+        'Gamma': (gamma, gamma),
+        'Vega': (vega, vega),
+        'Theta': (time_decay - r * strike_disc * cdf_d2 + q * spot_div_disc * cdf_d1,
+                  time_decay + r * strike_disc * (1 - cdf_d2) - q * spot_div_disc * (1 - cdf_d1)),
+        'Rho': (T * strike_disc * cdf_d2, -T * strike_disc * (1 - cdf_d2)),
+    }
+
+
+def _crr_lattice(S, X, r, T, v, q, steps, chunk_cells, with_european):
+    # Backward induction of Cox-Ross-Rubinstein binomial lattices (helper for American_Values and
+    # Early_Exercise_Premium)
+    # Returns the American call and put values, followed by the European ones of the same lattices when
+    # with_european is set
+    # Lattices are stored node-major (one row per node, one column per contract) so every step works on contiguous
+    # rows, and contracts are processed chunk_cells lattice nodes at a time, which keeps the working set in cache
+    S, X, r, T, v, q = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (S, X, r, T, v, q)))
+    shape = S.shape
+    S, X, r, T, v, q = (x.ravel() for x in (S, X, r, T, v, q))
+
+    values = [np.empty(S.size) for _ in range(4 if with_european else 2)]
+    nodes = np.arange(steps + 1)[:, np.newaxis]
+    chunk = max(1, chunk_cells // (steps + 1))
+    for start in range(0, S.size, chunk):
+        part = slice(start, start + chunk)
+        x = X[part]
+        dt = T[part] / steps
+        up = np.exp(v[part] * np.sqrt(dt))
+        down = 1 / up
+        # Risk-neutral up probability, clipped for steps too coarse for the drift
+        p_up = np.clip((np.exp((r[part] - q[part]) * dt) - down) / (up - down), 0.0, 1.0)
+        disc = np.exp(-r[part] * dt)
+        disc_up, disc_down = disc * p_up, disc * (1 - p_up)
+
+        # Spots and payoffs at maturity, node i having i up moves
+        spots = S[part] * up ** (2 * nodes - steps)
+        call_nodes = np.maximum(spots - x, 0.0)
+        put_nodes = np.maximum(x - spots, 0.0)
+        european_call, european_put = call_nodes, put_nodes
+
+        # Backward induction: continuation value or immediate exercise, whichever is worth more
+        for j in range(steps - 1, -1, -1):
+            spots = spots[:j + 1] * up
+            call_nodes = np.maximum(disc_down * call_nodes[:j + 1] + disc_up * call_nodes[1:j + 2], spots - x)
+            put_nodes = np.maximum(disc_down * put_nodes[:j + 1] + disc_up * put_nodes[1:j + 2], x - spots)
+            if with_european:
+                european_call = disc_down * european_call[:j + 1] + disc_up * european_call[1:j + 2]
+                european_put = disc_down * european_put[:j + 1] + disc_up * european_put[1:j + 2]
+
+        for out, root in zip(values, (call_nodes, put_nodes, european_call, european_put)):
+            out[part] = root[0]
+
+    return tuple(out.reshape(shape)[()] for out in values)
+
+
+@perf.timed()
+def american_values(S, X, r, T, v, q, steps=200, chunk_cells=100_000):
+    # Calculates American call and put values over arrays of inputs with a Cox-Ross-Rubinstein binomial lattice
+    # The parameters are explained in the Call_BS_Value function and broadcast against each other
+    # steps is the number of time steps of the lattice (more steps are more accurate and slower)
+    # Every contract is rolled back through its own lattice in the same vectorized backward induction, the calls
+    # and puts sharing the node spots
+    return _crr_lattice(S, X, r, T, v, q, steps, chunk_cells, with_european=False)
+
+
+@perf.timed()
+def early_exercise_premium(S, X, r, T, v, q, steps=200, chunk_cells=100_000):
+    # Calculates the value of the right to exercise early (American minus European value) of calls and puts
+    # The parameters are explained in American_Values
+    # Both values come from the same lattices, so the discretization error of the lattice cancels out and a call
+    # without dividends has no premium at any step count
+    call, put, european_call, european_put = _crr_lattice(S, X, r, T, v, q, steps, chunk_cells, with_european=True)
+    return np.maximum(call - european_call, 0.0), np.maximum(put - european_put, 0.0)
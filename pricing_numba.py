@@ -0,0 +1,71 @@
+import math
+import os
+
+import numpy as np
+from numba import config, guvectorize, njit
+
+
+# Numba kernels for the optional 'numba' backend of pricing.py (imported by pricing.py only when numba is installed)
+# d_1/d_2, the normal CDFs and the discounting of a call and a put are fused into one compiled loop per option,
+# so no temporary arrays are allocated; inputs broadcast like NumPy ufunc arguments
+# Large inputs run on every core, small ones and scalars on a serial kernel that avoids the threading overhead
+
+# Smallest number of options priced with the multi-threaded kernel
+PARALLEL_MIN_SIZE = 20_000
+
+# TBB, numba's first choice of threading layer, hangs the interpreter at exit when it is started from a worker
+# thread (the chain fetch prices on a thread pool), so OpenMP is preferred unless the priority is set explicitly
+if "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+    config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+
+_SIGNATURE = ["void(float64, float64, float64, float64, float64, float64, float64[:], float64[:])"]
+_LAYOUT = "(),(),(),(),(),()->(),()"
+
+
+@njit(cache=True, error_model="numpy")
+def _bs_values_scalar(S, X, r, T, v, q):
+    vol_sqrt_t = v * math.sqrt(T)
+    d_1 = (math.log(S / X) + (r - q + v * v * 0.5) * T) / vol_sqrt_t
+    d_2 = d_1 - vol_sqrt_t
+    spot_disc = S * math.exp(-q * T)
+    strike_disc = X * math.exp(-r * T)
+    # Normal CDF through erfc, accurate in both tails
+    call = spot_disc * 0.5 * math.erfc(-d_1 * 0.7071067811865476) \
+        - strike_disc * 0.5 * math.erfc(-d_2 * 0.7071067811865476)
+    put = strike_disc * 0.5 * math.erfc(d_2 * 0.7071067811865476) \
+        - spot_disc * 0.5 * math.erfc(d_1 * 0.7071067811865476)
+    return call, put
+
+
+def _bs_values_kernel(S, X, r, T, v, q, call, put):
+    call[0], put[0] = _bs_values_scalar(S, X, r, T, v, q)
+
+
+_bs_values_serial = guvectorize(_SIGNATURE, _LAYOUT, target="cpu", nopython=True, cache=True)(_bs_values_kernel)
+_bs_values_parallel = guvectorize(_SIGNATURE, _LAYOUT, target="parallel", nopython=True, cache=True)(
+    _bs_values_kernel)
+
+
+def bs_values(S, X, r, T, v, q):
+    # Same contract as pricing.bs_values: call and put values over broadcast inputs
+    # Plain Python numbers skip the array machinery altogether
+    if all(type(arg) in (float, int) for arg in (S, X, r, T, v, q)):
+        call, put = _bs_values_scalar(float(S), float(X), float(r), float(T), float(v), float(q))
+        return np.float64(call), np.float64(put)
+
+    args = (S, X, r, T, v, q)
+    size = int(np.prod(np.broadcast_shapes(*(np.shape(arg) for arg in args))))
+    kernel = _bs_values_parallel if size >= PARALLEL_MIN_SIZE else _bs_values_serial
+    if any(_wraps(arg) for arg in args):
+        # The kernels are NumPy gufuncs, so pandas aligns Series / DataFrame inputs and wraps the outputs exactly as
+        # it does for the NumPy backend's arithmetic
+        return kernel(*args)
+    call, put = kernel(*(np.asarray(arg, dtype=np.float64) for arg in args))
+    if call.ndim == 0:
+        return call[()], put[()]
+    return call, put
+
+
+def _wraps(arg):
+    # True for array-likes with their own ufunc handling (pandas objects), whose type the outputs keep
+    return hasattr(arg, "__array_ufunc__") and not isinstance(arg, (np.ndarray, np.generic))
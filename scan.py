@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+import functions as f
+from data_sources import SyntheticSource
+
+
+# Headless mispricing scan over many tickers
+# Each ticker is fetched and priced in a worker process and its mispricing (theoretical minus market price of
+# every contract over a spot grid) is written to <output>/<TICKER>.parquet as soon as it finishes
+# Finished tickers are skipped when the scan is run again, so an interrupted scan resumes where it stopped
+#
+# Usage:
+#   python scan.py SPY QQQ AAPL --output scan_results
+#   python scan.py --tickers-file tickers.txt --workers 8 --spot-range 0.8 1.2
+
+
+PROGRESS_FILE = "_progress.jsonl"
+
+
+def scan_ticker(ticker_symbol, output_dir, spot_range, risk_free_rate, dividend_yield, synthetic=False):
+    # Worker: fetches one ticker, prices its whole chain and writes the mispricing table to Parquet
+    # Returns the number of contracts priced
+    start = time.perf_counter()
+    source = SyntheticSource() if synthetic else None
+    calls_all, puts_all, spot_price = f.get_option_chains_spot(ticker_symbol, source=source)
+
+    min_spot, max_spot = spot_range[0] * spot_price, spot_range[1] * spot_price
+    call_df, put_df = f.calculate_market_prices(min_spot, max_spot, calls_all, puts_all, risk_free_rate,
+                                                dividend_yield)
+
+    table = pd.concat([_long_format(ticker_symbol, 'C', calls_all, call_df, spot_price),
+                       _long_format(ticker_symbol, 'P', puts_all, put_df, spot_price)], ignore_index=True)
+
+    # Write then rename, so a file in the output directory is always a complete result
+    path = os.path.join(output_dir, f"{ticker_symbol}.parquet")
+    table.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return {"ticker": ticker_symbol, "status": "done", "contracts": len(calls_all) + len(puts_all),
+            "seconds": time.perf_counter() - start}
+
+
+def _long_format(ticker_symbol, put_or_call, options, mispricing_df, spot_price):
+    # One row per contract and grid spot
+    n_spots = mispricing_df.shape[1]
+    return pd.DataFrame({
+        "ticker": ticker_symbol,
+        "option_type": put_or_call,
+        "underlying_spot": spot_price,
+        "strike": np.repeat(options["strike"].to_numpy(), n_spots),
+        "expiration": np.repeat(options["expiration"].to_numpy(), n_spots),
+        "implied_volatility": np.repeat(options["impliedVolatility"].to_numpy(), n_spots),
+        "last_price": np.repeat(options["lastPrice"].to_numpy(), n_spots),
+        "spot": np.tile(mispricing_df.columns.to_numpy(dtype=float), len(options)),
+        "mispricing": mispricing_df.to_numpy().ravel(),
+    })
+
+
+def read_tickers(args):
+    tickers = [ticker.upper() for ticker in args.tickers]
+    if args.tickers_file:
+        with open(args.tickers_file) as tickers_file:
+            tickers += [line.strip().upper() for line in tickers_file if line.strip() and not line.startswith("#")]
+    # Keep the first occurrence of every ticker
+    return list(dict.fromkeys(tickers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan option chains of many tickers for mispricing")
+    parser.add_argument("tickers", nargs="*", help="ticker symbols")
+    parser.add_argument("--tickers-file", help="file with one ticker symbol per line")
+    parser.add_argument("--output", default="scan_results", help="directory the per-ticker Parquet files go to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--spot-range", type=float, nargs=2, default=(0.5, 1.5), metavar=("MIN", "MAX"),
+                        help="spot grid as fractions of the current spot price")
+    parser.add_argument("--risk-free-rate", type=float, default=0.03)
+    parser.add_argument("--dividend-yield", type=float, default=0.0)
+    parser.add_argument("--no-resume", action="store_true", help="rescan tickers that already have results")
+    parser.add_argument("--synthetic", action="store_true", help="use synthetic chains instead of Yahoo Finance")
+    args = parser.parse_args(argv)
+
+    tickers = read_tickers(args)
+    if not tickers:
+        parser.error("no tickers given")
+
+    os.makedirs(args.output, exist_ok=True)
+    pending = [ticker for ticker in tickers
+               if args.no_resume or not os.path.exists(os.path.join(args.output, f"{ticker}.parquet"))]
+    skipped = len(tickers) - len(pending)
+    if skipped:
+        print(f"Resuming: {skipped} of {len(tickers)} tickers already scanned")
+
+    start = time.perf_counter()
+    done, failed, contracts = 0, 0, 0
+    progress_path = os.path.join(args.output, PROGRESS_FILE)
+    max_in_flight = 2 * args.workers
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, open(progress_path, "a") as progress:
+        queue = iter(pending)
+        in_flight = {}
+        while True:
+            # Keep at most max_in_flight tickers submitted, so memory stays flat whatever the ticker count
+            for ticker in queue:
+                future = pool.submit(scan_ticker, ticker, args.output, args.spot_range, args.risk_free_rate,
+                                     args.dividend_yield, args.synthetic)
+                in_flight[future] = ticker
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                ticker = in_flight.pop(future)
+                try:
+                    record = future.result()
+                    done += 1
+                    contracts += record["contracts"]
+                except Exception as e:
+                    record = {"ticker": ticker, "status": "failed", "error": str(e)}
+                    failed += 1
+                progress.write(json.dumps(record) + "\n")
+                progress.flush()
+                print(f"[{done + failed}/{len(pending)}] {ticker}: {record['status']}"
+                      + (f" ({record['contracts']} contracts)" if record["status"] == "done" else
+                         f" ({record['error']})"))
+
+    elapsed = time.perf_counter() - start
+    print(f"\nScanned {done} tickers ({failed} failed, {skipped} skipped) in {elapsed:.1f} s: "
+          f"{done / elapsed if elapsed else 0:.2f} tickers/s, {contracts / elapsed if elapsed else 0:.0f} contracts/s")
+    print(f"Results in {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
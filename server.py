@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from http import HTTPStatus
+
+import numpy as np
+
+import pricing
+
+
+# Local HTTP/JSON pricing service on top of the vectorized kernels of pricing.py
+# Runs on localhost only, with an asyncio front end and no external services
+#
+# Endpoints (POST a JSON object of arrays or scalars, broadcast against each other as in pricing.py):
+#   /price   S, X, r, T, v, q, put_or_call          -> {"price": [...]}
+#   /greeks  S, X, r, T, v, q, put_or_call          -> {"delta": [...], "gamma": [...], "vega": [...], ...}
+#   /iv      S, X, r, T, option_price, q, put_or_call -> {"iv": [...], "status": [...]}
+#   GET /metrics -> latency and throughput per endpoint
+#
+# Concurrent requests to the same endpoint are coalesced: the requests arriving within max_delay seconds of
+# each other (up to max_batch contracts) are concatenated and priced in a single vectorized call
+#
+# Usage:
+#   python server.py --port 8765
+#   curl -s localhost:8765/price -d '{"S": 100, "X": [90, 100, 110], "r": 0.03, "T": 1, "v": 0.2, "q": 0,
+#                                     "put_or_call": "C"}'
+
+
+def _price_kernel(S, X, r, T, v, q, put_or_call):
+    call, put = pricing.bs_values(S, X, r, T, v, q)
+    return {"price": np.where(put_or_call == 'C', call, put)}
+
+
+def _greeks_kernel(S, X, r, T, v, q, put_or_call):
+    is_call = put_or_call == 'C'
+    greeks = pricing.bs_greeks(S, X, r, T, v, q)
+    return {greek.lower(): np.where(is_call, call, put) for greek, (call, put) in greeks.items()}
+
+
+def _iv_kernel(S, X, r, T, option_price, q, put_or_call):
+    iv, status = pricing.implied_volatility(S, X, r, T, option_price, put_or_call, q)
+    return {"iv": iv, "status": status}
+
+
+ENDPOINTS = {
+    "/price": (_price_kernel, ("S", "X", "r", "T", "v", "q", "put_or_call")),
+    "/greeks": (_greeks_kernel, ("S", "X", "r", "T", "v", "q", "put_or_call")),
+    "/iv": (_iv_kernel, ("S", "X", "r", "T", "option_price", "q", "put_or_call")),
+}
+
+
+class Batcher:
+    # Coalesces concurrent requests of one endpoint into vectorized kernel calls
+
+    def __init__(self, kernel, fields, max_batch, max_delay):
+        self.kernel = kernel
+        self.fields = fields
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.contracts = 0
+
+    async def submit(self, columns):
+        # columns holds one equal-length array per field; returns the kernel outputs for these contracts
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((columns, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            size = len(items[0][0][self.fields[0]])
+            deadline = loop.time() + self.max_delay
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0][self.fields[0]])
+
+            batch = {field: np.concatenate([columns[field] for columns, _ in items]) for field in self.fields}
+            try:
+                # Priced on a worker thread so the event loop keeps accepting requests
+                outputs = await loop.run_in_executor(None, lambda: self.kernel(**batch))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.contracts += size
+            offset = 0
+            for columns, future in items:
+                n = len(columns[self.fields[0]])
+                future.set_result({name: values[offset:offset + n] for name, values in outputs.items()})
+                offset += n
+
+
+class PricingServer:
+    # host and port to listen on; max_batch and max_delay (seconds) bound each coalesced batch
+
+    def __init__(self, host="127.0.0.1", port=8765, max_batch=100_000, max_delay=0.002):
+        self.host = host
+        self.port = port
+        self.batchers = {path: Batcher(kernel, fields, max_batch, max_delay)
+                         for path, (kernel, fields) in ENDPOINTS.items()}
+        self.latencies = {path: deque(maxlen=10_000) for path in ENDPOINTS}
+        self.requests = {path: 0 for path in ENDPOINTS}
+        self.started = time.time()
+
+    async def serve(self):
+        for batcher in self.batchers.values():
+            asyncio.create_task(batcher.run())
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Pricing server listening on http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        # HTTP/1.1 connection with keep-alive, one JSON request and response at a time
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self.dispatch(method, path, body)
+                data = json.dumps(payload).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, self.metrics()
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}
+        if path not in ENDPOINTS:
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {path}."}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Use POST for {path}."}
+
+        start = time.perf_counter()
+        batcher = self.batchers[path]
+        try:
+            request = json.loads(body)
+            missing = [field for field in batcher.fields if field not in request]
+            if missing:
+                raise ValueError(f"Missing fields: {', '.join(missing)}.")
+            columns = dict(zip(batcher.fields, (np.ravel(column) for column in np.broadcast_arrays(
+                *(np.asarray(request[field], dtype=str if field == "put_or_call" else np.float64)
+                  for field in batcher.fields)))))
+            if not np.isin(columns["put_or_call"], ("C", "P")).all():
+                raise ValueError("put_or_call must be 'C' or 'P'.")
+        except (TypeError, ValueError) as e:
+            # Malformed JSON, missing fields, values of the wrong type (e.g. "S": {}) or shapes that do not broadcast
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+
+        outputs = await batcher.submit(columns)
+        self.requests[path] += 1
+        self.latencies[path].append(time.perf_counter() - start)
+        return HTTPStatus.OK, {name: _to_json_list(values) for name, values in outputs.items()}
+
+    def metrics(self):
+        uptime = time.time() - self.started
+        metrics = {"uptime_seconds": uptime, "endpoints": {}}
+        for path, batcher in self.batchers.items():
+            latencies = np.array(self.latencies[path]) * 1000
+            metrics["endpoints"][path] = {
+                "requests": self.requests[path],
+                "batches": batcher.batches,
+                "contracts": batcher.contracts,
+                "mean_batch_contracts": batcher.contracts / batcher.batches if batcher.batches else 0,
+                "contracts_per_second": batcher.contracts / uptime if uptime else 0,
+                "latency_ms": {f"p{p}": float(np.percentile(latencies, p)) for p in (50, 95, 99)}
+                if latencies.size else {},
+            }
+        return metrics
+
+
+def _to_json_list(values):
+    # NaN and +-inf are not valid JSON, they are sent as null
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        finite = np.isfinite(values).tolist()
+        return [value if ok else None for value, ok in zip(values.tolist(), finite)]
+    return values.tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Black-Scholes pricing service (prices, IV and Greeks)")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on (localhost by default)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=100_000, help="most contracts per coalesced batch")
+    parser.add_argument("--max-delay-ms", type=float, default=2.0,
+                        help="how long a request waits for others to coalesce with")
+    args = parser.parse_args(argv)
+
+    server = PricingServer(args.host, args.port, args.max_batch, args.max_delay_ms / 1000)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
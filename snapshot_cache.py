@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from pyarrow import feather
+
+import functions as f
+import perf
+
+
+# On-disk cache of option chain snapshots
+# Layout: <root>/<TICKER>/<fetch time in ms>/{calls.feather, puts.feather, meta.json}
+# Snapshots are uncompressed Feather (Arrow IPC) files, so loading one involves no decompression, only the
+# conversion of the Arrow columns to pandas (the returned DataFrames are fully materialized in memory)
+
+
+class SnapshotStore:
+    # root is the store directory
+    # ttl is the age in seconds after which a snapshot is no longer served by load_option_chains_spot
+    # max_bytes is the total store size above which the oldest snapshots are evicted
+
+    def __init__(self, root=".snapshots", ttl=900, max_bytes=500 * 1024 ** 2):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _ticker_dir(self, ticker_symbol):
+        return os.path.join(self.root, re.sub(r"[^A-Z0-9._-]", "_", ticker_symbol.upper()))
+
+    def _snapshots(self, ticker_symbol=None):
+        # (fetched_at, path) of the stored snapshots, newest first
+        if ticker_symbol is None:
+            ticker_dirs = [entry.path for entry in os.scandir(self.root) if entry.is_dir()] \
+                if os.path.isdir(self.root) else []
+        else:
+            ticker_dirs = [self._ticker_dir(ticker_symbol)]
+
+        snapshots = []
+        for ticker_dir in ticker_dirs:
+            if not os.path.isdir(ticker_dir):
+                continue
+            for entry in os.scandir(ticker_dir):
+                if entry.is_dir() and entry.name.isdigit():
+                    snapshots.append((int(entry.name) / 1000.0, entry.path))
+        return sorted(snapshots, reverse=True)
+
+    def save(self, ticker_symbol, calls_all, puts_all, spot_price, fetched_at=None):
+        # Stores a snapshot and evicts old ones if the store grew past max_bytes
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        path = os.path.join(self._ticker_dir(ticker_symbol), str(int(fetched_at * 1000)))
+
+        # Write into a temporary directory first so readers never see a partial snapshot; its name is unique to
+        # this call, so concurrent saves (threads or processes) never write into the same directory
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(tmp_path)
+            feather.write_feather(calls_all, os.path.join(tmp_path, "calls.feather"), compression="uncompressed")
+            feather.write_feather(puts_all, os.path.join(tmp_path, "puts.feather"), compression="uncompressed")
+            with open(os.path.join(tmp_path, "meta.json"), "w") as meta:
+                json.dump({"ticker": ticker_symbol, "spot_price": float(spot_price), "fetched_at": fetched_at}, meta)
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                # Another save stored a snapshot of the same millisecond first, it is kept
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            # Left behind when the write failed or the target already existed
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self.evict()
+        return path
+
+    def latest(self, ticker_symbol, max_age=None):
+        # Returns (calls_all, puts_all, spot_price, fetched_at) of the newest snapshot of a ticker
+        # Returns None if there is none, or if the newest is older than max_age seconds
+        snapshots = self._snapshots(ticker_symbol)
+        if not snapshots:
+            return None
+
+        fetched_at, path = snapshots[0]
+        if max_age is not None and time.time() - fetched_at > max_age:
+            return None
+
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        calls_all = feather.read_feather(os.path.join(path, "calls.feather"))
+        puts_all = feather.read_feather(os.path.join(path, "puts.feather"))
+        return calls_all, puts_all, meta["spot_price"], meta["fetched_at"]
+
+    def size(self):
+        # Total size of the stored snapshots in bytes
+        return sum(_dir_size(path) for _, path in self._snapshots())
+
+    def evict(self):
+        # Removes the oldest snapshots until the store fits in max_bytes (the newest one is always kept)
+        snapshots = [(fetched_at, path, _dir_size(path)) for fetched_at, path in self._snapshots()]
+        total = sum(size for _, _, size in snapshots)
+        while total > self.max_bytes and len(snapshots) > 1:
+            _, path, size = snapshots.pop()
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def _dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+@perf.timed()
+def load_option_chains_spot(ticker_symbol, store, replay=False, **fetch_kwargs):
+    # Cached front end of Get_Option_Chains_Spot, returns (calls_all, puts_all, spot_price, fetched_at)
+    # A snapshot younger than the store TTL is served from disk; otherwise the chain is fetched and stored
+    # With replay=True the newest stored snapshot is used whatever its age, without any network access
+    # fetch_kwargs are passed to Get_Option_Chains_Spot
+    if replay:
+        snapshot = store.latest(ticker_symbol)
+        if snapshot is None:
+            raise ValueError(f"No stored snapshot to replay for ticker {ticker_symbol}.")
+        return snapshot
+
+    snapshot = store.latest(ticker_symbol, max_age=store.ttl)
+    if snapshot is not None:
+        return snapshot
+
+    fetched_at = time.time()
+    calls_all, puts_all, spot_price = f.get_option_chains_spot(ticker_symbol, **fetch_kwargs)
+    store.save(ticker_symbol, calls_all, puts_all, spot_price, fetched_at=fetched_at)
+    return calls_all, puts_all, spot_price, fetched_at